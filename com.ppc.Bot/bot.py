@@ -9,11 +9,14 @@ file 'LICENSE.txt', which is part of this source code package.
 
 import json
 import utilities.utilities as utilities
+import utilities.analytics as analytics
 import domain
 
 import localization
 
 from controller import Controller
+import persistence
+import datarequest
 
 def run(botengine):
     """
@@ -30,8 +33,8 @@ def run(botengine):
     print("\n\n")
     botengine.get_logger().info("TRIGGER : " + str(trigger_type))
     
-    # Grab our non-volatile memory
-    controller = load_controller(botengine)
+    # Grab our non-volatile memory. Measurements only need the devices involved, so other devices stay in storage.
+    controller = load_controller(botengine, lazy=trigger_type & botengine.TRIGGER_DEVICE_MEASUREMENT != 0)
 
     # RESET
     if trigger_type == 0:
@@ -232,53 +235,38 @@ def run(botengine):
         # Response to botengine.request_data()
         botengine.get_logger().info("Data request received")
         data = botengine.get_data_block()
-        events = {}
-        imported = False
-
-        import importlib
-        try:
-            import lz4.block
-            imported = True
-        except ImportError:
-            botengine.get_logger().error("Attempted to import 'lz4' to uncompress the data request response, but lz4 is not available. Please add 'lz4' to 'pip_install_remotely' in your structure.json.")
-            pass
-
-        if imported:
-            for d in data:
-                reference = None
-                if 'key' in d:
-                    reference = d['key']
-
-                if reference not in events:
-                    events[reference] = {}
-
-                botengine.get_logger().info("Downloading {} ({} bytes)...".format(d['deviceId'], d['compressedLength']))
-                r = botengine._requests.get(d['url'], timeout=60, stream=True)
-                events[reference][controller.get_device(d['deviceId'])] = lz4.block.decompress(r.content, uncompressed_size=d['dataLength'])
 
-            for reference in events:
-                controller.data_request_ready(botengine, reference, events[reference])
+        # Each reference is ready as soon as all of its files are downloaded, while the rest keep downloading
+        for reference, device_csv_dict in datarequest.download(botengine, data):
+            controller.data_request_ready(botengine, reference, datarequest.CsvDict((controller.get_device(device_id), csv) for device_id, csv in device_csv_dict.items()))
 
         # DO NOT SAVE CORE VARIABLES HERE.
+        controller.flush_location_properties(botengine)
+        controller.flush_analytics(botengine)
+        analytics.join(botengine)
         return
 
     else:
         botengine.get_logger().error("bot.py: Unknown trigger {}".format(trigger_type))
     
     # Always save your variables!
-    botengine.save_variable("controller", controller, required_for_each_execution=True)
+    controller.flush_location_properties(botengine)
+    controller.flush_analytics(botengine)
+    persistence.save_controller(botengine, controller)
+    analytics.join(botengine)
     botengine.get_logger().info("<< bot")
     
     
     
-def load_controller(botengine):
+def load_controller(botengine, lazy=False):
     """
     Load the Controller object
     :param botengine: Execution environment
+    :param lazy: True to only load and initialize each device when it's accessed
     """
     logger = botengine.get_logger()
     try:
-        controller = botengine.load_variable("controller")
+        controller = persistence.load_controller(botengine, lazy)
         logger.info("Loaded the controller")
 
     except:
@@ -288,7 +276,7 @@ def load_controller(botengine):
     if controller == None:
         botengine.get_logger().info("Bot : Creating a new Controller object. Hello.")
         controller = Controller()
-        botengine.save_variable("controller", controller, required_for_each_execution=True)
+        persistence.save_controller(botengine, controller)
 
     controller.track_new_and_deleted_devices(botengine)
     controller.initialize(botengine)
@@ -315,7 +303,10 @@ def _location_intelligence_fired(botengine, argument_tuple):
         import traceback
         botengine.get_logger().error("{}; {}".format(str(e), traceback.format_exc()))
 
-    botengine.save_variable("controller", controller, required_for_each_execution=True)
+    controller.flush_location_properties(botengine)
+    controller.flush_analytics(botengine)
+    persistence.save_controller(botengine, controller)
+    analytics.join(botengine)
     botengine.get_logger().info("<< bot (location timer)")
 
 def start_location_intelligence_timer(botengine, seconds, intelligence_id, argument, reference):
@@ -396,7 +387,10 @@ def _device_intelligence_fired(botengine, argument_tuple):
         import traceback
         botengine.get_logger().error("{}; {}".format(str(e), traceback.format_exc()))
 
-    botengine.save_variable("controller", controller, required_for_each_execution=True)
+    controller.flush_location_properties(botengine)
+    controller.flush_analytics(botengine)
+    persistence.save_controller(botengine, controller)
+    analytics.join(botengine)
     botengine.get_logger().info("<< bot (device timer)")
     
 
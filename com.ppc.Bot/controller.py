@@ -11,44 +11,8 @@ import copy
 
 from locations.location import Location
 
-from devices.camera.camera_peoplepower_presenceandroid import PeoplePowerPresenceAndroidCameraDevice
-from devices.camera.camera_peoplepower_presenceios import PeoplePowerPresenceIosCameraDevice
-from devices.entry.entry import EntryDevice
-from devices.entry.entry_develco import DevelcoEntryDevice
-from devices.environment.temperature import TemperatureDevice
-from devices.environment.temperaturehumidity import TemperatureHumidityDevice
-from devices.gateway.gateway_peoplepower_xseries import PeoplePowerXSeriesDevice
-from devices.gateway.gateway_peoplepower_edge import PeoplePowerEdgeDevice
-from devices.gateway.gateway_peoplepower_mseries import PeoplePowerMSeriesDevice
-from devices.gateway.gateway_qorvo_lcgw import QorvoLcgwGatewayDevice
-from devices.gateway.gateway_develco_squidlink import DevelcoSquidlinkDevice
-from devices.leak.leak import LeakDevice
-from devices.light.light import LightDevice
-from devices.light.lightswitch_ge import LightswitchGeDevice
-from devices.motion.motion import MotionDevice
-from devices.motion.motion_develco import DevelcoMotionDevice
-from devices.movement.touch import TouchDevice
-from devices.siren.siren_linkhigh import LinkhighSirenDevice
-from devices.siren.siren_smartenit_zbalarm import SmartenitZbalarmDevice
-from devices.siren.siren_develco import DevelcoSirenDevice
-from devices.smartplug.smartplug import SmartplugDevice
-from devices.smartplug.smartplug_centralite_3series import Centralite3SeriesSmartplugDevice  # TODO how do we cast objects that are already created with this into a different class?
-from devices.thermostat.thermostat_centralite_pearl import ThermostatCentralitePearlDevice
-from devices.thermostat.thermostat_honeywell_lyric import ThermostatHoneywellLyricDevice
-from devices.thermostat.thermostat_sensibo_sky import ThermostatSensiboSkyDevice
-from devices.thermostat.thermostat_ecobee import ThermostatEcobeeDevice
-from devices.thermostat.thermostat_emerson_thermostat import ThermostatEmersonDevice
-from devices.touchpad.touchpad_peoplepower import PeoplePowerTouchpadDevice
-from devices.button.button import ButtonDevice
-from devices.lock.lock import LockDevice
-from devices.gas.carbon_monoxide import CarbonMonoxideDevice
-from devices.pictureframe.pictureframe_peoplepower_ios import PeoplePowerPictureFrameIosDevice
-from devices.pictureframe.pictureframe_peoplepower_android import PeoplePowerPictureFrameAndroidDevice
-from devices.smartplug.smartplug_smartenit_largeload import SmartenitLargeLoadControllerDevice
-from devices.pressure.pressure import PressurePadDevice
-from devices.keypad.keypad_develco import DevelcoKeypadDevice
-from devices.leak.leak_develco import DevelcoLeakDevice
-from devices.smartplug.smartplug_develco import DevelcoSmartplugDevice
+import devices.registry as registry
+import utilities.analytics as analytics
 
 class Controller:
     """This is the main class that will coordinate all our sensors and behavior"""
@@ -65,6 +29,12 @@ class Controller:
 
         # Last execution timestamp for debugging support
         self.exec_timestamp = 0
+
+        # Index of microservices by intelligence ID, so timers find their microservice directly. { 'intelligence_id': (location_id, device_id or None, module_name) }
+        self.intelligence_index = {}
+
+        # Signature of each device's information in the access block from the last execution. { 'device_id': signature }
+        self.access_signatures = {}
         
         
     def initialize(self, botengine, initialize_everything=True):
@@ -90,7 +60,17 @@ class Controller:
         self.exec_timestamp = botengine.get_timestamp()
 
         for key in self.locations:
+            if hasattr(self.locations[key].devices, 'is_loaded'):
+                # Devices whose stored variable went missing get created again from the access block. See persistence.LazyDict.
+                self.locations[key].devices.on_missing = lambda device_id: self._recreate_device(botengine, device_id)
+
             self.locations[key].initialize(botengine, initialize_everything)
+
+        # Re-index microservices only when some were added or removed
+        for key in self.locations:
+            if getattr(self.locations[key], 'microservices_changed', True):
+                self._rebuild_intelligence_index()
+                break
     
     def print_status(self, botengine):
         """
@@ -124,6 +104,12 @@ class Controller:
             botengine.get_logger().error("Bot Server error: No 'access' block in our inputs!")
             return
 
+        # Device IDs found in the access block for this execution
+        accessible_device_ids = set()
+
+        if not hasattr(self, 'access_signatures'):
+            self.access_signatures = {}
+
         # Maintenance: Add new devices
         for item in access:
             if item['category'] == botengine.ACCESS_CATEGORY_MODE:
@@ -143,6 +129,12 @@ class Controller:
                     device_desc = ""
 
                 device_id = str(item['device']['deviceId'])
+                accessible_device_ids.add(device_id)
+
+                # Skip devices whose access information hasn't changed since the last execution, so they don't have to be loaded
+                signature = self._access_signature(item)
+                if device_id in self.location_devices and self.access_signatures.get(device_id) == signature and self._is_stored(device_id):
+                    continue
                 device_type = int(item['device']['deviceType'])
                 location_id = int(item['device']['locationId'])
 
@@ -163,121 +155,13 @@ class Controller:
                         continue
                 
                 if device_object is None:
-                    if device_type in PeoplePowerPresenceAndroidCameraDevice.DEVICE_TYPES:
-                        device_object = PeoplePowerPresenceAndroidCameraDevice(botengine, device_id, device_type, device_desc, precache_measurements)
-                        
-                    elif device_type in PeoplePowerPresenceIosCameraDevice.DEVICE_TYPES:
-                        device_object = PeoplePowerPresenceIosCameraDevice(botengine, device_id, device_type, device_desc, precache_measurements)
-                        
-                    elif device_type in EntryDevice.DEVICE_TYPES:
-                        device_object = EntryDevice(botengine, device_id, device_type, device_desc, precache_measurements)
-                    
-                    elif device_type in TemperatureDevice.DEVICE_TYPES:
-                        device_object = TemperatureDevice(botengine, device_id, device_type, device_desc, precache_measurements)
-                        
-                    elif device_type in TemperatureHumidityDevice.DEVICE_TYPES:
-                        device_object = TemperatureHumidityDevice(botengine, device_id, device_type, device_desc, precache_measurements)
-                        
-                    elif device_type in PeoplePowerMSeriesDevice.DEVICE_TYPES:
-                        device_object = PeoplePowerMSeriesDevice(botengine, device_id, device_type, device_desc, precache_measurements)
-
-                    elif device_type in PeoplePowerXSeriesDevice.DEVICE_TYPES:
-                        device_object = PeoplePowerXSeriesDevice(botengine, device_id, device_type, device_desc, precache_measurements)
-
-                    elif device_type in PeoplePowerEdgeDevice.DEVICE_TYPES:
-                        device_object = PeoplePowerEdgeDevice(botengine, device_id, device_type, device_desc, precache_measurements)
-
-                    elif device_type in DevelcoSquidlinkDevice.DEVICE_TYPES:
-                        device_object = DevelcoSquidlinkDevice(botengine, device_id, device_type, device_desc, precache_measurements)
-
-                    elif device_type in QorvoLcgwGatewayDevice.DEVICE_TYPES:
-                        device_object = QorvoLcgwGatewayDevice(botengine, device_id, device_type, device_desc, precache_measurements)
-                        
-                    elif device_type in LeakDevice.DEVICE_TYPES:
-                        device_object = LeakDevice(botengine, device_id, device_type, device_desc, precache_measurements)
-                        
-                    elif device_type in LightDevice.DEVICE_TYPES:
-                        device_object = LightDevice(botengine, device_id, device_type, device_desc, precache_measurements)
-                        
-                    elif device_type in LightswitchGeDevice.DEVICE_TYPES:
-                        device_object = LightswitchGeDevice(botengine, device_id, device_type, device_desc, precache_measurements)
-                        
-                    elif device_type in MotionDevice.DEVICE_TYPES:
-                        device_object = MotionDevice(botengine, device_id, device_type, device_desc, precache_measurements)
-                        
-                    elif device_type in TouchDevice.DEVICE_TYPES:
-                        device_object = TouchDevice(botengine, device_id, device_type, device_desc, precache_measurements)
-                        
-                    elif device_type in SmartenitZbalarmDevice.DEVICE_TYPES:
-                        device_object = SmartenitZbalarmDevice(botengine, device_id, device_type, device_desc, precache_measurements)
-
-                    elif device_type in LinkhighSirenDevice.DEVICE_TYPES:
-                        device_object = LinkhighSirenDevice(botengine, device_id, device_type, device_desc, precache_measurements)
-
-                    elif device_type in SmartplugDevice.DEVICE_TYPES:
-                        device_object = SmartplugDevice(botengine, device_id, device_type, device_desc, precache_measurements)
-                        
-                    elif device_type in ThermostatCentralitePearlDevice.DEVICE_TYPES:
-                        device_object = ThermostatCentralitePearlDevice(botengine, device_id, device_type, device_desc, precache_measurements)
-                    
-                    elif device_type in ThermostatHoneywellLyricDevice.DEVICE_TYPES:
-                        device_object = ThermostatHoneywellLyricDevice(botengine, device_id, device_type, device_desc, precache_measurements)
-                        
-                    elif device_type in ThermostatSensiboSkyDevice.DEVICE_TYPES:
-                        device_object = ThermostatSensiboSkyDevice(botengine, device_id, device_type, device_desc, precache_measurements)
-
-                    elif device_type in ThermostatEcobeeDevice.DEVICE_TYPES:
-                        device_object = ThermostatEcobeeDevice(botengine, device_id, device_type, device_desc, precache_measurements)
-                        
-                    elif device_type in PeoplePowerTouchpadDevice.DEVICE_TYPES:
-                        device_object = PeoplePowerTouchpadDevice(botengine, device_id, device_type, device_desc, precache_measurements)
-
-                    elif device_type in ButtonDevice.DEVICE_TYPES:
-                        device_object = ButtonDevice(botengine, device_id, device_type, device_desc, precache_measurements)
-
-                    elif device_type in LockDevice.DEVICE_TYPES:
-                        device_object = LockDevice(botengine, device_id, device_type, device_desc, precache_measurements)
-
-                    elif device_type in CarbonMonoxideDevice.DEVICE_TYPES:
-                        device_object = CarbonMonoxideDevice(botengine, device_id, device_type, device_desc, precache_measurements)
-
-                    elif device_type in PeoplePowerPictureFrameIosDevice.DEVICE_TYPES:
-                        device_object = PeoplePowerPictureFrameIosDevice(botengine, device_id, device_type, device_desc, precache_measurements)
-
-                    elif device_type in PeoplePowerPictureFrameAndroidDevice.DEVICE_TYPES:
-                        device_object = PeoplePowerPictureFrameAndroidDevice(botengine, device_id, device_type, device_desc, precache_measurements)
-
-                    elif device_type in SmartenitLargeLoadControllerDevice.DEVICE_TYPES:
-                        device_object = SmartenitLargeLoadControllerDevice(botengine, device_id, device_type, device_desc, precache_measurements)
-
-                    elif device_type in DevelcoMotionDevice.DEVICE_TYPES:
-                        device_object = DevelcoMotionDevice(botengine, device_id, device_type, device_desc, precache_measurements)
-
-                    elif device_type in DevelcoEntryDevice.DEVICE_TYPES:
-                        device_object = DevelcoEntryDevice(botengine, device_id, device_type, device_desc, precache_measurements)
-
-                    elif device_type in PressurePadDevice.DEVICE_TYPES:
-                        device_object = PressurePadDevice(botengine, device_id, device_type, device_desc, precache_measurements)
-
-                    elif device_type in ThermostatEmersonDevice.DEVICE_TYPES:
-                        device_object = ThermostatEmersonDevice(botengine, device_id, device_type, device_desc, precache_measurements)
-
-                    elif device_type in DevelcoSirenDevice.DEVICE_TYPES:
-                        device_object = DevelcoSirenDevice(botengine, device_id, device_type, device_desc, precache_measurements)
-
-                    elif device_type in DevelcoKeypadDevice.DEVICE_TYPES:
-                        device_object = DevelcoKeypadDevice(botengine, device_id, device_type, device_desc, precache_measurements)
-
-                    elif device_type in DevelcoLeakDevice.DEVICE_TYPES:
-                        device_object = DevelcoLeakDevice(botengine, device_id, device_type, device_desc, precache_measurements)
-
-                    elif device_type in DevelcoSmartplugDevice.DEVICE_TYPES:
-                        device_object = DevelcoSmartplugDevice(botengine, device_id, device_type, device_desc, precache_measurements)
-
-                    else:
+                    device_class = registry.get_device_class(device_type, botengine)
+                    if device_class is None:
                         botengine.get_logger().warn("Unsupported device type: " + str(device_type) + " ('" + device_desc + "')")
                         continue
 
+                    device_object = device_class(botengine, device_id, device_type, device_desc, precache_measurements)
+
                 if 'connected' in item['device']:
                     device_object.is_connected = item['device']['connected']
                 else:
@@ -301,6 +185,7 @@ class Controller:
                     device_object.born_on = int(item['device']['startDate'])
 
                 self.sync_device(botengine, location_id, device_id, device_object)
+                self.access_signatures[device_id] = signature
 
                 if hasattr(device_object, "latitude") and hasattr(device_object, "longitude"):
                     if 'latitude' in item['device'] and 'longitude' in item['device']:
@@ -309,19 +194,47 @@ class Controller:
 
         # Maintenance: Prune out old devices
         for device_id in copy.copy(self.location_devices):
-            found = False
-
-            for item in access:
-                if item['category'] == botengine.ACCESS_CATEGORY_DEVICE:
-                    if 'device' in item:
-                        if item['device']['deviceId'] == device_id:
-                            found = True
-                            break
-    
-            if not found:
+            if device_id not in accessible_device_ids:
                 self.delete_device(botengine, device_id)
     
 
+    def _is_stored(self, device_id):
+        """
+        Internal method to check that a tracked device is still in its location, without loading it
+        :param device_id: Device ID
+        :return: True if the device's location still has the device
+        """
+        location_id = self.location_devices[device_id]
+        return location_id in self.locations and device_id in self.locations[location_id].devices
+
+    def _recreate_device(self, botengine, device_id):
+        """
+        Internal method to create a device again after its stored variable went missing
+        :param botengine: BotEngine environment
+        :param device_id: Device ID
+        :return: New device object, or None if the device isn't in our access block
+        """
+        botengine.get_logger().warning("controller: Creating device {} again because it was missing from storage".format(device_id))
+        self.location_devices.pop(device_id, None)
+        self.access_signatures.pop(device_id, None)
+        self.track_new_and_deleted_devices(botengine)
+
+        device_object = self.get_device(device_id)
+        if device_object is not None:
+            device_object.initialize(botengine)
+        return device_object
+
+    def _access_signature(self, item):
+        """
+        Internal method to summarize the parts of a device's access block item that track_new_and_deleted_devices() applies
+        :param item: Device item from the access block
+        :return: Signature that changes whenever the device's access information changes
+        """
+        device = item['device']
+        return (device.get('description'), device['deviceType'], device['locationId'], device.get('connected'),
+                device.get('remoteAddrHash'), device.get('proxyId'), device.get('goalId'), device.get('startDate'),
+                device.get('latitude'), device.get('longitude'), item.get('read'), item.get('control'))
+
     def sync_device(self, botengine, location_id, device_id, device_object):
         """
         Synchronize the device with the tracking system
@@ -346,6 +259,10 @@ class Controller:
             self.locations[location_id] = Location(botengine, location_id)
 
         # Make sure the device is being tracked, and it's in the correct location
+        if device_id in self.location_devices and self.location_devices[device_id] in self.locations and device_id not in self.locations[self.location_devices[device_id]].devices:
+            # The device was tracked, but its location lost it because it was missing from storage
+            del self.location_devices[device_id]
+
         if device_id not in self.location_devices:
             # The device isn't being tracked at all - add it
             botengine.get_logger().info("\t=> Now tracking device " + str(device_id))
@@ -359,6 +276,7 @@ class Controller:
             self.locations[self.location_devices[device_id]].delete_device(botengine, device_id)
             self.location_devices[device_id] = location_id
             self.locations[location_id].devices[device_id] = device_object
+            self.locations[location_id].microservices_changed = True
             device_object.location_object = self.locations[location_id]
     
     def device_measurements_updated(self, botengine, location_id, device_object):
@@ -453,6 +371,22 @@ class Controller:
 
         self.locations[location_id].call_center_updated(botengine, user_id, status)
 
+    def flush_location_properties(self, botengine):
+        """
+        Write back the location properties changed during this execution, right before analytics are flushed
+        :param botengine: BotEngine environment
+        """
+        for location_id in self.locations:
+            self.locations[location_id].flush_location_properties(botengine)
+
+    def flush_analytics(self, botengine):
+        """
+        Flush the analytics buffered during this execution, right before variables get saved
+        :param botengine: BotEngine environment
+        """
+        for location_id in self.locations:
+            analytics.flush(botengine, self.locations[location_id])
+
     def data_request_ready(self, botengine, reference, device_csv_dict):
         """
         A botengine.request_data() request is ready
@@ -515,11 +449,10 @@ class Controller:
                 self.locations[location_id].timer_fired(botengine, argument)
                 return
 
-            # Search for and trigger location intelligence instances
-            for intelligence_module_name in self.locations[location_id].intelligence_modules:
-                if intelligence_id == self.locations[location_id].intelligence_modules[intelligence_module_name].intelligence_id:
-                    self.locations[location_id].intelligence_modules[intelligence_module_name].timer_fired(botengine, argument)
-                    return
+        # Trigger the location intelligence instance
+        intelligence_object = self.get_intelligence_module(intelligence_id)
+        if intelligence_object is not None:
+            intelligence_object.timer_fired(botengine, argument)
 
     def run_device_intelligence(self, botengine, intelligence_id, argument):
         """
@@ -529,12 +462,76 @@ class Controller:
         :param argument: Argument to pass into the timer_fired() method of the intelligence module
         """
         botengine.get_logger().info("Device Intelligence Timer Fired: " + str(intelligence_id))
+        intelligence_object = self.get_intelligence_module(intelligence_id)
+        if intelligence_object is not None:
+            intelligence_object.timer_fired(botengine, argument)
+
+    def get_intelligence_module(self, intelligence_id):
+        """
+        Get the location or device microservice with the given intelligence ID
+        :param intelligence_id: ID of the intelligence module
+        :return: the intelligence module object, or None if it doesn't exist
+        """
+        if not hasattr(self, 'intelligence_index'):
+            # Controllers saved before the index existed
+            self._rebuild_intelligence_index()
+
+        intelligence_object = self._lookup_intelligence_module(intelligence_id)
+        if intelligence_object is None:
+            # The index may be stale if microservices changed since it was built
+            self._rebuild_intelligence_index()
+            intelligence_object = self._lookup_intelligence_module(intelligence_id)
+
+        return intelligence_object
+
+    def _lookup_intelligence_module(self, intelligence_id):
+        """
+        Internal method to find a microservice through the intelligence index without rebuilding it
+        :param intelligence_id: ID of the intelligence module
+        :return: the intelligence module object, or None if the index doesn't point to it
+        """
+        if intelligence_id not in self.intelligence_index:
+            return None
+
+        location_id, device_id, module_name = self.intelligence_index[intelligence_id]
+        if location_id not in self.locations:
+            return None
+
+        parent = self.locations[location_id]
+        if device_id is not None:
+            if device_id not in parent.devices:
+                return None
+            parent = parent.devices[device_id]
+
+        intelligence_object = parent.intelligence_modules.get(module_name)
+        if intelligence_object is None or intelligence_object.intelligence_id != intelligence_id:
+            return None
+
+        return intelligence_object
+
+    def _rebuild_intelligence_index(self):
+        """
+        Internal method to index all location and device microservices by their intelligence ID
+        """
+        previous_index = getattr(self, 'intelligence_index', {})
+        self.intelligence_index = {}
         for location_id in self.locations:
-            for device_id in self.locations[location_id].devices:
-                for intelligence_module_name in self.locations[location_id].devices[device_id].intelligence_modules:
-                    if intelligence_id == self.locations[location_id].devices[device_id].intelligence_modules[intelligence_module_name].intelligence_id:
-                        self.locations[location_id].devices[device_id].intelligence_modules[intelligence_module_name].timer_fired(botengine, argument)
-                        return
+            location = self.locations[location_id]
+            for module_name in location.intelligence_modules:
+                self.intelligence_index[location.intelligence_modules[module_name].intelligence_id] = (location_id, None, module_name)
+
+            for device_id in location.devices:
+                if hasattr(location.devices, 'is_loaded') and not location.devices.is_loaded(device_id):
+                    # This device is still in storage, so its microservices haven't changed
+                    for intelligence_id in previous_index:
+                        if previous_index[intelligence_id][:2] == (location_id, device_id):
+                            self.intelligence_index[intelligence_id] = previous_index[intelligence_id]
+
+                elif hasattr(location.devices[device_id], "intelligence_modules"):
+                    for module_name in location.devices[device_id].intelligence_modules:
+                        self.intelligence_index[location.devices[device_id].intelligence_modules[module_name].intelligence_id] = (location_id, device_id, module_name)
+
+            location.microservices_changed = False
 
     def run_intelligence_schedules(self, botengine, schedule_id):
         """
@@ -564,6 +561,9 @@ class Controller:
         :param device_id: Device ID to delete
         """
         botengine.get_logger().info("Deleting device: " + str(device_id))
+        if hasattr(self, 'access_signatures'):
+            self.access_signatures.pop(device_id, None)
+
         if device_id in self.location_devices:
             if self.location_devices[device_id] in self.locations:
                 location = self.locations[self.location_devices[device_id]]
@@ -0,0 +1,257 @@
+'''
+Created on October 17, 2026
+
+This file is subject to the terms and conditions defined in the
+file 'LICENSE.txt', which is part of this source code package.
+
+@author: David Moss
+'''
+
+import mmap
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import domain
+
+# Maximum number of files to download at the same time
+MAXIMUM_DOWNLOAD_THREADS = 8
+
+# Seconds to wait to connect to the server, and between bytes received from the server, for each file
+DOWNLOAD_CONNECT_TIMEOUT_S = 10
+DOWNLOAD_READ_TIMEOUT_S = 30
+
+# Number of times to try downloading each file before giving up
+DOWNLOAD_ATTEMPTS = 3
+
+# Seconds to wait before the second attempt. This doubles after each failed attempt.
+DOWNLOAD_BACKOFF_S = 0.5
+
+# Bytes read from the network at a time
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Bytes copied at a time by SpooledCsv.write_to()
+SPOOL_CHUNK_SIZE = 1024 * 1024
+
+
+def is_spooled():
+    """
+    :return: True if this bot hands out data request CSV files as SpooledCsv objects instead of bytes. See domain.SPOOL_DATA_REQUESTS.
+    """
+    return getattr(domain, 'SPOOL_DATA_REQUESTS', False)
+
+
+def csv_content(content):
+    """
+    Prepare uncompressed CSV data to hand out to microservices
+    :param content: Uncompressed CSV bytes
+    :return: SpooledCsv if this bot spools data requests, otherwise the bytes themselves
+    """
+    if is_spooled():
+        return SpooledCsv(content)
+    return content
+
+
+def close(content):
+    """
+    Release CSV data from csv_content() once the bot is done with it
+    :param content: SpooledCsv or bytes
+    """
+    if isinstance(content, SpooledCsv):
+        content.close()
+
+
+class CsvDict(dict):
+    """
+    { device_object: bytes or SpooledCsv } handed to data_request_ready().
+    Unlike a plain dict this can be weakly referenced, so anything derived from it can go away along with it.
+    """
+    pass
+
+
+def download(botengine, data):
+    """
+    Download and uncompress the files from a TRIGGER_DATA_REQUEST data block.
+
+    Files download in parallel over one pool of connections, and each file is uncompressed as soon as it arrives.
+    The files for each reference are yielded as soon as all of them are done, so the bot can process one reference
+    while the files for the next are still downloading. A file that can't be downloaded is logged and left out.
+
+    Each uncompressed file is handed out as bytes. Bots that set domain.SPOOL_DATA_REQUESTS get a SpooledCsv instead,
+    so only the files being downloaded right now are held in memory. The temporary files are deleted once the bot is
+    done with each reference.
+
+    :param botengine: BotEngine environment
+    :param data: Data block from botengine.get_data_block()
+    :return: Generator of (reference, { 'device_id': bytes or SpooledCsv }) tuples
+    """
+    try:
+        import lz4.block
+    except ImportError:
+        botengine.get_logger().error("Attempted to import 'lz4' to uncompress the data request response, but lz4 is not available. Please add 'lz4' to 'pip_install_remotely' in your structure.json.")
+        return
+
+    import requests
+    import requests.adapters
+
+    if len(data) == 0:
+        return
+
+    # Number of files still downloading for each reference
+    remaining = {}
+    for d in data:
+        reference = d.get('key')
+        remaining[reference] = remaining.get(reference, 0) + 1
+
+    threads = min(len(data), MAXIMUM_DOWNLOAD_THREADS)
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=threads)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    def _download(d):
+        """
+        Download and uncompress one file. This runs on a pool thread.
+        :param d: Element of the data block
+        :return: (element of the data block, bytes or SpooledCsv or None, error or None)
+        """
+        error = None
+        for attempt in range(DOWNLOAD_ATTEMPTS):
+            if attempt > 0:
+                time.sleep(DOWNLOAD_BACKOFF_S * 2 ** (attempt - 1))
+
+            try:
+                r = session.get(d['url'], timeout=(DOWNLOAD_CONNECT_TIMEOUT_S, DOWNLOAD_READ_TIMEOUT_S), stream=True)
+                try:
+                    r.raise_for_status()
+
+                    # An lz4 block has to be uncompressed in one piece, so stream the compressed file into one buffer
+                    # instead of letting the response hold its chunks and a joined copy of them.
+                    compressed = bytearray()
+                    for chunk in r.iter_content(DOWNLOAD_CHUNK_SIZE):
+                        compressed.extend(chunk)
+
+                finally:
+                    r.close()
+
+                return d, csv_content(lz4.block.decompress(compressed, uncompressed_size=d['dataLength'])), None
+
+            except Exception as e:
+                error = e
+
+        return d, None, error
+
+    # multiprocessing.pool.ThreadPool needs shared memory for its queues and locks, which isn't available on the server
+    events = {}
+    executor = ThreadPoolExecutor(max_workers=threads)
+    futures = [executor.submit(_download, d) for d in data]
+    consumed = set()
+    try:
+        for future in as_completed(futures):
+            consumed.add(future)
+            d, content, error = future.result()
+            reference = d.get('key')
+            if reference not in events:
+                events[reference] = {}
+
+            if content is not None:
+                botengine.get_logger().info("Downloaded {} ({} bytes)".format(d['deviceId'], d['compressedLength']))
+                events[reference][d['deviceId']] = content
+
+            else:
+                botengine.get_logger().warning("Unable to download {} after {} attempts: {}".format(d['deviceId'], DOWNLOAD_ATTEMPTS, error))
+
+            remaining[reference] -= 1
+            if remaining[reference] == 0:
+                csv_dict = events.pop(reference)
+                try:
+                    yield reference, csv_dict
+                finally:
+                    for csv in csv_dict.values():
+                        close(csv)
+
+    finally:
+        for future in futures:
+            future.cancel()
+
+        executor.shutdown(wait=True)
+        session.close()
+
+        # Files that finished downloading after the bot stopped reading
+        for future in futures:
+            if future not in consumed and not future.cancelled():
+                close(future.result()[1])
+
+        for csv_dict in events.values():
+            for csv in csv_dict.values():
+                close(csv)
+
+
+class SpooledCsv:
+    """
+    Uncompressed CSV data from a data request, spooled to a temporary file and memory-mapped back in.
+    Bots opt into this with domain.SPOOL_DATA_REQUESTS, once their microservices can read it.
+
+    This reads like bytes for the most common uses: len() is the size in bytes, indexing or slicing returns bytes,
+    and decode() returns the text. It is not a bytes object though, and str() returns the decoded text.
+    The operating system pages the data in as it's read and can drop it again under memory pressure, so many large
+    files don't have to fit in memory at once. Iterating returns one line at a time.
+    """
+
+    def __init__(self, content):
+        """
+        Constructor
+        :param content: Uncompressed bytes to spool
+        """
+        # Memory-mapped temporary file, or the bytes themselves if they're empty because an empty file can't be mapped
+        self.data = content
+
+        if len(content) > 0:
+            with tempfile.TemporaryFile() as f:
+                f.write(content)
+                f.flush()
+                self.data = mmap.mmap(f.fileno(), len(content), access=mmap.ACCESS_READ)
+
+    def close(self):
+        """
+        Release the memory-mapped file. The data can't be read after this.
+        """
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def write_to(self, f):
+        """
+        Copy the data into a binary file without reading it all into memory at once
+        :param f: File-like object opened for writing bytes
+        """
+        for start in range(0, len(self), SPOOL_CHUNK_SIZE):
+            f.write(self.data[start:start + SPOOL_CHUNK_SIZE])
+
+    def decode(self, encoding='utf-8', errors='strict'):
+        """
+        Read all the data into memory and decode it, like bytes.decode()
+        :param encoding: Text encoding
+        :param errors: Error handling scheme
+        :return: Text
+        """
+        return self.data[:].decode(encoding, errors)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        return self.data[index]
+
+    def __contains__(self, value):
+        return self.data.find(value) >= 0
+
+    def __iter__(self):
+        start = 0
+        while start < len(self.data):
+            end = self.data.find(b"\n", start)
+            end = len(self.data) if end < 0 else end + 1
+            yield self.data[start:end]
+            start = end
+
+    def __str__(self):
+        return self.decode()
@@ -8,6 +8,7 @@ file 'LICENSE.txt', which is part of this source code package.
 '''
 
 import utilities.utilities as utilities
+from devices.measurement_history import MeasurementHistory
 import intelligence.index
 import importlib
 
@@ -26,6 +27,9 @@ RELIABILITY_VARIABLE_NAME = "reliability"
 # Total duration of time in which we should cache measurements here locally.
 TOTAL_DURATION_TO_CACHE_MEASUREMENTS_MS = utilities.ONE_HOUR_MS
 
+# Maximum number of measurements to keep for each parameter when we're not enforcing the cache size by time
+MAXIMUM_MEASUREMENTS_PER_PARAMETER = 10000
+
 # Take a battery reading every 4 hours
 BATTERY_MEASUREMENT_PERIODICITY_MS = utilities.ONE_HOUR_MS * 6
 
@@ -98,7 +102,7 @@ class Device:
         self.location_object = None
         
         # Measurements for each parameter, newest measurements at index 0
-        # self.measurements["parameterName"] = [ ( newest_value, newest_timestamp ), ( value, timestamp ), ... ]
+        # self.measurements["parameterName"] = MeasurementHistory: [ ( newest_value, newest_timestamp ), ( value, timestamp ), ... ]
         self.measurements = {}
 
         # Spaces this device is associated with. For example:
@@ -217,6 +221,7 @@ class Device:
                             botengine.get_logger().info("\tAdding device microservice: " + str(intelligence_info['module']))
                             intelligence_object = class_(botengine, self)
                             self.intelligence_modules[intelligence_info['module']] = intelligence_object
+                            self._microservices_changed()
                         except Exception as e:
                             import traceback
                             botengine.get_logger().error("Could not add device microservice: {}: {}; {}".format(str(intelligence_info), str(e), traceback.format_exc()))
@@ -237,6 +242,7 @@ class Device:
 
                 for d in delete:
                     del self.intelligence_modules[d]
+                    self._microservices_changed()
 
 
             for i in self.intelligence_modules:
@@ -247,6 +253,14 @@ class Device:
             # There are no intelligence modules for this device type, and yet we have some intelligence modules locally. Delete everything.
             botengine.get_logger().info("\tDeleting all device microservices")
             self.intelligence_modules = {}
+            self._microservices_changed()
+
+    def _microservices_changed(self):
+        """
+        Internal method to let our location know that microservices on this device were added or removed
+        """
+        if self.location_object is not None:
+            self.location_object.microservices_changed = True
 
     def destroy(self, botengine):
         """
@@ -299,7 +313,8 @@ class Device:
         :return:
         """
         for intelligence_id in self.intelligence_modules:
-            self.intelligence_modules[intelligence_id].device_measurements_updated(botengine, self)
+            if self.intelligence_modules[intelligence_id].implements('device_measurements_updated'):
+                self.intelligence_modules[intelligence_id].device_measurements_updated(botengine, self)
 
     def device_metadata_updated(self, botengine):
         """
@@ -308,7 +323,8 @@ class Device:
         :return:
         """
         for intelligence_id in self.intelligence_modules:
-            self.intelligence_modules[intelligence_id].device_metadata_updated(botengine, self)
+            if self.intelligence_modules[intelligence_id].implements('device_metadata_updated'):
+                self.intelligence_modules[intelligence_id].device_metadata_updated(botengine, self)
 
     def device_alert(self, botengine, alert_type, alert_params):
         """
@@ -318,7 +334,8 @@ class Device:
         :param alert_params: Dictionary of alert parameters
         """
         for intelligence_id in self.intelligence_modules:
-            self.intelligence_modules[intelligence_id].device_alert(botengine, self, alert_type, alert_params)
+            if self.intelligence_modules[intelligence_id].implements('device_alert'):
+                self.intelligence_modules[intelligence_id].device_alert(botengine, self, alert_type, alert_params)
 
     #===========================================================================
     # Measurement synchronization and updates
@@ -378,7 +395,7 @@ class Device:
         self.communicated(botengine.get_timestamp())
         botengine.get_logger().info("Updating: " + self.description)
 
-        measures = botengine.get_measures_block()
+        measures = get_device_measures(botengine, self.device_id)
 
         # # Handy debug tool.
         # if measures is not None:
@@ -402,40 +419,31 @@ class Device:
         #             else:
         #                 botengine.get_logger().info(utilities.Color.GREEN + "\tTIME DIFF: {} @ {} = {}".format(param_name, measure['time'], measure['value']) + utilities.Color.END)
 
-        if measures is not None:
-            for measure in measures:
-                if measure['deviceId'] == self.device_id:
-                    param_name = measure['name']
-                    if param_name == 'rssi':
-                        if measure['updated']:
-                            # Update the RSSI
-                            rssi = int(measure['value'])
-                            self.update_rssi(botengine, rssi)
-                            self.last_updated_params.append('rssi')
-                        else:
-                            # RSSI didn't change
-                            self.rssi_status_quo(botengine)
-                    
-                    elif param_name == 'batteryLevel' and measure['updated']:
-                        # Update the battery_level
-                        self.battery_level = int(measure['value'])
-                        self.last_updated_params.append('batteryLevel')
-                        
-                    elif param_name not in self.measurements or measure['updated']:
-                        if 'value' not in measure:
-                            #botengine.get_logger().error("device.py: Measurement has no value: " + str(measure) + ";\n Measures block was: " + str(botengine.get_measures_block()))
-                            continue
-
-                        value = utilities.normalize_measurement(measure['value'])
-
-                        # If there's an index number, we just augment the parameter name with the index number to make it a unique parameter name.  param_name.index
-                        if 'index' in measure:
-                            if measure['index'] is not None:
-                                if str(measure['index']).lower() != "none":
-                                    param_name = "{}.{}".format(param_name, measure['index'])
-
-                        self.add_measurement(botengine, param_name, value, measure['time'])
-                        self.last_updated_params.append(param_name)
+        for measure, indexed_param_name in measures:
+            param_name = measure['name']
+            if param_name == 'rssi':
+                if measure['updated']:
+                    # Update the RSSI
+                    rssi = int(measure['value'])
+                    self.update_rssi(botengine, rssi)
+                    self.last_updated_params.append('rssi')
+                else:
+                    # RSSI didn't change
+                    self.rssi_status_quo(botengine)
+
+            elif param_name == 'batteryLevel' and measure['updated']:
+                # Update the battery_level
+                self.battery_level = int(measure['value'])
+                self.last_updated_params.append('batteryLevel')
+
+            elif param_name not in self.measurements or measure['updated']:
+                if 'value' not in measure:
+                    #botengine.get_logger().error("device.py: Measurement has no value: " + str(measure) + ";\n Measures block was: " + str(botengine.get_measures_block()))
+                    continue
+
+                value = utilities.normalize_measurement(measure['value'])
+                self.add_measurement(botengine, indexed_param_name, value, measure['time'])
+                self.last_updated_params.append(indexed_param_name)
 
         # List of devices (this one and its proxy) that were updated, to later synchronize with the location outside of this object
         updated_devices = []
@@ -469,7 +477,8 @@ class Device:
         :param file_extension: The file extension, for example 'mp4'
         """
         for intelligence_id in self.intelligence_modules:
-            self.intelligence_modules[intelligence_id].file_uploaded(botengine, device_object, file_id, filesize_bytes, content_type, file_extension)
+            if self.intelligence_modules[intelligence_id].implements('file_uploaded'):
+                self.intelligence_modules[intelligence_id].file_uploaded(botengine, device_object, file_id, filesize_bytes, content_type, file_extension)
 
     def add_measurement(self, botengine, name, value, timestamp):
         """
@@ -485,14 +494,19 @@ class Device:
 
         if name not in self.measurements:
             # Create the measurement
-            self.measurements[name] = []
+            self.measurements[name] = MeasurementHistory()
+
+        elif not isinstance(self.measurements[name], MeasurementHistory):
+            # Measurements saved as a list by an older version of this bot
+            self.measurements[name] = MeasurementHistory(self.measurements[name])
 
-        self.measurements[name].insert(0, (value, timestamp))
+        self.measurements[name].append(value, timestamp)
 
         # Auto garbage-collect
         if self.enforce_cache_size:
-            while (len(self.measurements[name]) > 1) and self.measurements[name][-1][1] <= botengine.get_timestamp() - TOTAL_DURATION_TO_CACHE_MEASUREMENTS_MS:
-                del(self.measurements[name][-1])
+            self.measurements[name].trim(oldest_timestamp=botengine.get_timestamp() - TOTAL_DURATION_TO_CACHE_MEASUREMENTS_MS)
+        else:
+            self.measurements[name].trim(maximum_length=MAXIMUM_MEASUREMENTS_PER_PARAMETER)
 
     def communicated(self, timestamp):
         """
@@ -614,13 +628,15 @@ class Device:
 
         # Notify my microservices
         for intelligence_id in self.intelligence_modules:
-            self.intelligence_modules[intelligence_id].coordinates_updated(botengine, latitude, longitude)
+            if self.intelligence_modules[intelligence_id].implements('coordinates_updated'):
+                self.intelligence_modules[intelligence_id].coordinates_updated(botengine, latitude, longitude)
 
         # Notify all children microservices
         for device_id in self.location_object.devices:
             if self.location_object.devices[device_id].proxy_id == self.device_id:
                 for intelligence_id in self.location_object.devices[device_id].intelligence_modules:
-                    self.location_object.devices[device_id].intelligence_modules[intelligence_id].coordinates_updated(botengine, latitude, longitude)
+                    if self.location_object.devices[device_id].intelligence_modules[intelligence_id].implements('coordinates_updated'):
+                        self.location_object.devices[device_id].intelligence_modules[intelligence_id].coordinates_updated(botengine, latitude, longitude)
 
     #===========================================================================
     # Spaces
@@ -720,7 +736,7 @@ class Device:
     #===========================================================================
     # CSV methods for machine learning algorithm integrations
     #===========================================================================
-    def get_csv(self, botengine, oldest_timestamp_ms=None, newest_timestamp_ms=None, params=[]):
+    def get_csv(self, botengine, oldest_timestamp_ms=None, newest_timestamp_ms=None, params=[], output_file=None):
         """
         Get a .csv string of all the data
 
@@ -736,7 +752,63 @@ class Device:
         :param oldest_timestamp_ms: oldest timestamp in milliseconds
         :param newest_timestamp_ms: newest timestamp in milliseconds
         :param params: List of parameters
-        :return: .csv string, largely matching the .csv data you would receive from the "botengine --download_device [device_id]" command line interface. Or None if this device doesn't have data.
+        :param output_file: Optional file-like object to stream the .csv data into, instead of building a string
+        :return: .csv string, largely matching the .csv data you would receive from the "botengine --download_device [device_id]" command line interface. Or the output_file if one was given. Or None if this device doesn't have data.
+        """
+        readings = self._get_readings(botengine, oldest_timestamp_ms, newest_timestamp_ms, params)
+        if readings is None:
+            return None
+
+        titles, rows = readings
+        return utilities.write_lines(self._csv_lines(botengine, titles, rows), output_file)
+
+    def get_columns(self, botengine, oldest_timestamp_ms=None, newest_timestamp_ms=None, params=[], numpy=False):
+        """
+        Get the same data as get_csv(), as one column per parameter instead of .csv text.
+        Machine learning algorithms can use this directly without parsing .csv strings.
+
+        There is one row for each timestamp where any of the parameters was measured. Each parameter's column carries its most recent
+        value forward to the rows where it wasn't measured, and is None before its first measurement in this time range.
+
+        :param botengine: BotEngine environment
+        :param oldest_timestamp_ms: oldest timestamp in milliseconds
+        :param newest_timestamp_ms: newest timestamp in milliseconds
+        :param params: List of parameters
+        :param numpy: True to return each column as a NumPy array, if numpy is available in this bot
+        :return: { 'timestamp_ms': [timestamps], 'parameter_name': [values], ... }, or None if this device doesn't have data.
+        """
+        readings = self._get_readings(botengine, oldest_timestamp_ms, newest_timestamp_ms, params)
+        if readings is None:
+            return None
+
+        titles, rows = readings
+        columns = {'timestamp_ms': []}
+        current = {}
+        for t in titles:
+            columns[t] = []
+            current[t] = None
+
+        for timestamp_ms, values in rows:
+            current.update(values)
+            columns['timestamp_ms'].append(timestamp_ms)
+            for t in titles:
+                columns[t].append(current[t])
+
+        if numpy:
+            import numpy as np
+            for name in columns:
+                columns[name] = np.array(columns[name])
+
+        return columns
+
+    def _get_readings(self, botengine, oldest_timestamp_ms, newest_timestamp_ms, params):
+        """
+        Internal method to download measurements for get_csv() and get_columns(), grouped by timestamp
+        :param botengine: BotEngine environment
+        :param oldest_timestamp_ms: oldest timestamp in milliseconds
+        :param newest_timestamp_ms: newest timestamp in milliseconds
+        :param params: List of parameters
+        :return: ( [sorted parameter names], [ (timestamp_ms, { 'parameter_name': value }) ] sorted oldest first ), or None if this device doesn't have data.
         """
         if len(self.measurements) == 0:
             botengine.get_logger().info("{}: get_csv() - This device has no measurements")
@@ -747,27 +819,12 @@ class Device:
         else:
             titles = sorted(self.measurements.keys())
 
-        last_measurements = {}
-
-        for title in titles:
-            try:
-                last_measurements[title] = self.measurements[title][0][0]
-            except:
-                pass
-
         # Check to see that all the parameters we're requesting have valid measurements in this device object
         # Remember that an index number will modify the name of the parameter to make it unique, and we need to match against the unique name of each parameter
-        if not set(params).issubset(last_measurements.keys()):
+        if not set(params).issubset([t for t in titles if t in self.measurements and len(self.measurements[t]) > 0]):
             botengine.get_logger().info("{}: get_csv() - Not all of the requested parameters exist for this device")
             return None
 
-        output = "device_type,device_id,description,timestamp_ms,timestamp_iso,"
-
-        for t in titles:
-            output = "{}{},".format(output, t)
-
-        output += "\n"
-
         try:
             measurements = botengine.get_measurements(self.device_id, oldest_timestamp_ms=oldest_timestamp_ms, newest_timestamp_ms=newest_timestamp_ms, param_name=params)
 
@@ -776,6 +833,7 @@ class Device:
             # botengine.get_logger().warning("Cannot synchronize measurements for device: " + str(self.description))
             return None
 
+        # Every parameter measured at each timestamp. Parameters reported in the same millisecond share a row instead of overwriting each other.
         processed_readings = {}
         if 'measures' in measurements:
             for measure in measurements['measures']:
@@ -792,32 +850,77 @@ class Device:
                         if str(measure['index']).lower() != "none":
                             param_name = "{}.{}".format(param_name, measure['index'])
 
-                processed_readings[time] = (param_name, value)
+                if param_name in titles:
+                    processed_readings.setdefault(time, {})[param_name] = value
 
         measurements = None
         import gc
         gc.collect()
 
         botengine.get_logger().info("{}: get_csv() - Processing {} measurements ...".format(self.description, str(len(processed_readings))))
+        return titles, sorted(processed_readings.items(), key=lambda reading: reading[0])
 
-        for timestamp_ms in sorted(processed_readings.keys()):
-            dt = self.location_object.get_local_datetime_from_timestamp(botengine, timestamp_ms)
-            output += "{},{},{},{},{},".format(self.device_type, self.device_id.replace(",","_"), self.description.replace(",","_"), timestamp_ms, utilities.iso_format(dt))
+    def _csv_lines(self, botengine, titles, rows):
+        """
+        Internal generator of .csv lines for get_csv()
+        :param botengine: BotEngine environment
+        :param titles: Sorted list of parameter names, one column each
+        :param rows: [ (timestamp_ms, { 'parameter_name': value }) ] sorted oldest first
+        """
+        yield "device_type,device_id,description,timestamp_ms,timestamp_iso,{}\n".format("".join("{},".format(t) for t in titles))
 
-            for t in titles:
-                if t == processed_readings[timestamp_ms][0]:
-                    output += "{},".format(processed_readings[timestamp_ms][1])
-                else:
-                    output += "{},".format(last_measurements[t])
+        formatter = utilities.IsoFormatter(self.location_object.get_local_timezone(botengine))
+        prefix = "{},{},{},".format(self.device_type, self.device_id.replace(",","_"), self.description.replace(",","_"))
+
+        # Most recent value of each parameter, carried forward into rows where it wasn't measured. Empty until it's first measured.
+        current = dict((t, "") for t in titles)
 
-            output += "\n"
+        for timestamp_ms, values in rows:
+            current.update(values)
+            columns = [prefix, "{},{},".format(timestamp_ms, formatter.format(timestamp_ms))]
 
-        return output
+            for t in titles:
+                columns.append("{},".format(current[t]))
+
+            columns.append("\n")
+            yield "".join(columns)
 
 
 #===============================================================================
 # These functions are outside the Device class above.
 #===============================================================================
+# Measures block grouped by device ID for the current execution. (measures_block, { 'device_id': [ (measure, param_name) ] })
+_grouped_measures = (None, {})
+
+def get_device_measures(botengine, device_id):
+    """
+    Get the measurements in this execution's measures block for one device.
+    The block is grouped by device ID once per execution, so updating a gateway and all its child devices doesn't rescan it.
+    :param botengine: BotEngine environment
+    :param device_id: Device ID
+    :return: List of (measure, param_name) tuples, where param_name includes the measurement's index if it has one, like 'ppc.temp.1'
+    """
+    global _grouped_measures
+    measures = botengine.get_measures_block()
+    if measures is None:
+        return []
+
+    if _grouped_measures[0] is not measures:
+        grouped = {}
+        for measure in measures:
+            # If there's an index number, we just augment the parameter name with the index number to make it a unique parameter name.  param_name.index
+            param_name = measure['name']
+            if 'index' in measure:
+                if measure['index'] is not None:
+                    if str(measure['index']).lower() != "none":
+                        param_name = "{}.{}".format(param_name, measure['index'])
+
+            grouped.setdefault(measure['deviceId'], []).append((measure, param_name))
+
+        _grouped_measures = (measures, grouped)
+
+    return _grouped_measures[1].get(device_id, [])
+
 
 def send_command_reliably(botengine, device_id, param_name, param_value):
     """
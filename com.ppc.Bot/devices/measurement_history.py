@@ -0,0 +1,114 @@
+'''
+Created on October 17, 2026
+
+This file is subject to the terms and conditions defined in the
+file 'LICENSE.txt', which is part of this source code package.
+
+@author: David Moss
+'''
+
+from array import array
+from collections import deque
+
+
+class MeasurementHistory:
+    """
+    History of a single measurement parameter on a device, newest measurement first.
+
+    Indexing works like the list of (value, timestamp) tuples this replaces, so history[0][0] is the newest value
+    and history[0][1] is its timestamp. Values and timestamps are kept in parallel deques with the oldest measurement
+    on the left, so adding a new measurement and dropping old ones are O(1).
+    """
+
+    def __init__(self, measurements=None):
+        """
+        Constructor
+        :param measurements: Optional list of (value, timestamp) tuples, newest first
+        """
+        # Values, oldest first
+        self.values = deque()
+
+        # Timestamps in milliseconds, oldest first
+        self.timestamps = deque()
+
+        if measurements is not None:
+            for value, timestamp in reversed(list(measurements)):
+                self.append(value, timestamp)
+
+    def append(self, value, timestamp):
+        """
+        Add the newest measurement
+        :param value: Value
+        :param timestamp: Timestamp in milliseconds
+        """
+        self.values.append(value)
+        self.timestamps.append(timestamp)
+
+    def trim(self, oldest_timestamp=None, maximum_length=None):
+        """
+        Drop the oldest measurements. The newest measurement is always kept.
+        :param oldest_timestamp: Drop measurements at or before this timestamp in milliseconds
+        :param maximum_length: Drop measurements beyond this many
+        """
+        if oldest_timestamp is not None:
+            while len(self.timestamps) > 1 and self.timestamps[0] <= oldest_timestamp:
+                self.values.popleft()
+                self.timestamps.popleft()
+
+        if maximum_length is not None:
+            while len(self.timestamps) > max(1, maximum_length):
+                self.values.popleft()
+                self.timestamps.popleft()
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+
+        if index < 0 or index >= len(self):
+            raise IndexError("MeasurementHistory index out of range")
+
+        return (self.values[-1 - index], self.timestamps[-1 - index])
+
+    def __iter__(self):
+        return zip(reversed(self.values), reversed(self.timestamps))
+
+    def __eq__(self, other):
+        try:
+            return list(self) == list(other)
+        except TypeError:
+            # Not iterable, like None or a number
+            return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def __getstate__(self):
+        """
+        Store timestamps as a packed array of 64-bit integers when possible
+        :return: State of this object to save
+        """
+        try:
+            timestamps = array('q', self.timestamps)
+        except (ValueError, TypeError, OverflowError):
+            timestamps = list(self.timestamps)
+
+        return {'values': list(self.values), 'timestamps': timestamps}
+
+    def __setstate__(self, state):
+        """
+        :param state: State of this object from __getstate__()
+        """
+        self.values = deque(state['values'])
+        self.timestamps = deque(state['timestamps'])
@@ -121,13 +121,14 @@ class PressurePadDevice(Device):
     #===========================================================================
     # CSV methods for machine learning algorithm integrations
     #===========================================================================
-    def get_csv(self, botengine, oldest_timestamp_ms=None, newest_timestamp_ms=None):
+    def get_csv(self, botengine, oldest_timestamp_ms=None, newest_timestamp_ms=None, output_file=None):
         """
         Get a standardized .csv string of all the data
         :param botengine: BotEngine environment
         :param oldest_timestamp_ms: oldest timestamp in milliseconds
         :param newest_timestamp_ms: newest timestamp in milliseconds
-        :return: .csv string, largely matching the .csv data you would receive from the "botengine --download_device [device_id]" command line interface. Or None if this device doesn't have data.
+        :param output_file: Optional file-like object to stream the .csv data into, instead of building a string
+        :return: .csv string, largely matching the .csv data you would receive from the "botengine --download_device [device_id]" command line interface. Or the output_file if one was given. Or None if this device doesn't have data.
         """
-        return Device.get_csv(self, botengine, oldest_timestamp_ms=oldest_timestamp_ms, newest_timestamp_ms=newest_timestamp_ms, params=[PressurePadDevice.MEASUREMENT_NAME_STATUS])
+        return Device.get_csv(self, botengine, oldest_timestamp_ms=oldest_timestamp_ms, newest_timestamp_ms=newest_timestamp_ms, params=[PressurePadDevice.MEASUREMENT_NAME_STATUS], output_file=output_file)
 
@@ -0,0 +1,122 @@
+'''
+Created on October 17, 2026
+
+This file is subject to the terms and conditions defined in the
+file 'LICENSE.txt', which is part of this source code package.
+
+@author: David Moss
+'''
+
+import importlib
+
+# Device classes the controller can instantiate, in priority order.
+#
+# Each class registers itself through its own DEVICE_TYPES list the first time it is needed. Modules are imported
+# lazily, so a bot only pays the import cost for the device types its location actually has. When two classes
+# declare the same device type, the class listed first wins.
+#
+# To add a new device class to your bot, override this file or call register(YourDeviceClass) before devices get created.
+DEVICE_CLASSES = [
+    {"module": "devices.camera.camera_peoplepower_presenceandroid", "class": "PeoplePowerPresenceAndroidCameraDevice"},
+    {"module": "devices.camera.camera_peoplepower_presenceios", "class": "PeoplePowerPresenceIosCameraDevice"},
+    {"module": "devices.entry.entry", "class": "EntryDevice"},
+    {"module": "devices.environment.temperature", "class": "TemperatureDevice"},
+    {"module": "devices.environment.temperaturehumidity", "class": "TemperatureHumidityDevice"},
+    {"module": "devices.gateway.gateway_peoplepower_mseries", "class": "PeoplePowerMSeriesDevice"},
+    {"module": "devices.gateway.gateway_peoplepower_xseries", "class": "PeoplePowerXSeriesDevice"},
+    {"module": "devices.gateway.gateway_peoplepower_edge", "class": "PeoplePowerEdgeDevice"},
+    {"module": "devices.gateway.gateway_develco_squidlink", "class": "DevelcoSquidlinkDevice"},
+    {"module": "devices.gateway.gateway_qorvo_lcgw", "class": "QorvoLcgwGatewayDevice"},
+    {"module": "devices.leak.leak", "class": "LeakDevice"},
+    {"module": "devices.light.light", "class": "LightDevice"},
+    {"module": "devices.light.lightswitch_ge", "class": "LightswitchGeDevice"},
+    {"module": "devices.motion.motion", "class": "MotionDevice"},
+    {"module": "devices.movement.touch", "class": "TouchDevice"},
+    {"module": "devices.siren.siren_smartenit_zbalarm", "class": "SmartenitZbalarmDevice"},
+    {"module": "devices.siren.siren_linkhigh", "class": "LinkhighSirenDevice"},
+    {"module": "devices.smartplug.smartplug", "class": "SmartplugDevice"},
+    {"module": "devices.thermostat.thermostat_centralite_pearl", "class": "ThermostatCentralitePearlDevice"},
+    {"module": "devices.thermostat.thermostat_honeywell_lyric", "class": "ThermostatHoneywellLyricDevice"},
+    {"module": "devices.thermostat.thermostat_sensibo_sky", "class": "ThermostatSensiboSkyDevice"},
+    {"module": "devices.thermostat.thermostat_ecobee", "class": "ThermostatEcobeeDevice"},
+    {"module": "devices.touchpad.touchpad_peoplepower", "class": "PeoplePowerTouchpadDevice"},
+    {"module": "devices.button.button", "class": "ButtonDevice"},
+    {"module": "devices.lock.lock", "class": "LockDevice"},
+    {"module": "devices.gas.carbon_monoxide", "class": "CarbonMonoxideDevice"},
+    {"module": "devices.pictureframe.pictureframe_peoplepower_ios", "class": "PeoplePowerPictureFrameIosDevice"},
+    {"module": "devices.pictureframe.pictureframe_peoplepower_android", "class": "PeoplePowerPictureFrameAndroidDevice"},
+    {"module": "devices.smartplug.smartplug_smartenit_largeload", "class": "SmartenitLargeLoadControllerDevice"},
+    {"module": "devices.motion.motion_develco", "class": "DevelcoMotionDevice"},
+    {"module": "devices.entry.entry_develco", "class": "DevelcoEntryDevice"},
+    {"module": "devices.pressure.pressure", "class": "PressurePadDevice"},
+    {"module": "devices.thermostat.thermostat_emerson_thermostat", "class": "ThermostatEmersonDevice"},
+    {"module": "devices.siren.siren_develco", "class": "DevelcoSirenDevice"},
+    {"module": "devices.keypad.keypad_develco", "class": "DevelcoKeypadDevice"},
+    {"module": "devices.leak.leak_develco", "class": "DevelcoLeakDevice"},
+    {"module": "devices.smartplug.smartplug_develco", "class": "DevelcoSmartplugDevice"}
+]
+
+# Registered device classes. { device_type: DeviceClass }
+_device_classes = {}
+
+# Index of the next entry in DEVICE_CLASSES that has not been imported and registered yet
+_next_index = 0
+
+# Indexes of entries in DEVICE_CLASSES that failed to import, to try again the next time a device type isn't found
+_failed_indexes = []
+
+
+def register(device_class):
+    """
+    Register a device class for each device type in its DEVICE_TYPES list.
+    Device types that are already registered keep their existing class.
+    :param device_class: Device class to register
+    """
+    for device_type in device_class.DEVICE_TYPES:
+        if int(device_type) not in _device_classes:
+            _device_classes[int(device_type)] = device_class
+
+
+def get_device_class(device_type, botengine=None):
+    """
+    Get the device class that handles the given device type.
+    Device modules are imported in priority order only until the device type is found.
+    A module that fails to import is skipped for now and tried again the next time a device type isn't found.
+    :param device_type: Device type
+    :param botengine: BotEngine environment, to log modules that fail to import
+    :return: Device class, or None if this device type is not supported
+    """
+    global _next_index
+    device_type = int(device_type)
+
+    if device_type not in _device_classes:
+        for index in list(_failed_indexes):
+            _failed_indexes.remove(index)
+            _import(index, botengine)
+            if device_type in _device_classes:
+                break
+
+    while device_type not in _device_classes and _next_index < len(DEVICE_CLASSES):
+        index = _next_index
+        _next_index += 1
+        _import(index, botengine)
+
+    return _device_classes.get(device_type)
+
+
+def _import(index, botengine):
+    """
+    Import and register the device class at the given index of DEVICE_CLASSES
+    :param index: Index into DEVICE_CLASSES
+    :param botengine: BotEngine environment, or None
+    """
+    device_info = DEVICE_CLASSES[index]
+    try:
+        module = importlib.import_module(device_info['module'])
+        register(getattr(module, device_info['class']))
+
+    except Exception as e:
+        _failed_indexes.append(index)
+        if botengine is not None:
+            import traceback
+            botengine.get_logger().warning("registry.py: Could not import device class {}: {}; {}".format(device_info, str(e), traceback.format_exc()))
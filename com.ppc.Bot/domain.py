@@ -44,6 +44,10 @@ AMPLITUDE_TOKENS = {
     "sboxall.presencepro.com": ""
 }
 
+# True to hand data request CSV files to microservices as datarequest.SpooledCsv objects kept in temporary files,
+# instead of bytes. Only turn this on when every microservice's data_request_ready() can read a SpooledCsv.
+SPOOL_DATA_REQUESTS = False
+
 # iOS download URL
 APP_IOS_URL = ""
 
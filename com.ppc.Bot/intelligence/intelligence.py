@@ -10,10 +10,53 @@ file 'LICENSE.txt', which is part of this source code package.
 import bot
 from locations.location import Location
 
+# Cache of which event hooks each class of microservice implements. { (class, 'event_name'): True|False }
+_implemented_hooks = {}
+
+
+def _noop():
+    return
+
+
+def _documented_noop():
+    """
+    Documented
+    """
+    return
+
+
+# Bytecode of an event hook whose body is only a docstring and a bare 'return'
+_NOOP_BYTECODE = (_noop.__code__.co_code, _documented_noop.__code__.co_code)
+
+
+def _is_noop(function):
+    """
+    Determine if the given function does nothing but return None
+    :param function: Function to inspect
+    :return: True if the function body is empty
+    """
+    code = getattr(function, '__code__', None)
+    if code is None or code.co_code not in _NOOP_BYTECODE:
+        return False
+
+    for constant in code.co_consts:
+        if constant is not None and constant != function.__doc__:
+            return False
+
+    return True
+
+
 class Intelligence:
     """
     Base Intelligence Module Class / Interface
     """
+
+    # List of data stream addresses this microservice listens to.
+    # Leave this as None to listen by method name: the default datastream_updated() calls the method that has the same
+    # name as the address, so only those addresses are delivered. A microservice that overrides datastream_updated()
+    # without declaring its addresses here receives every data stream message, unless the override is a bare 'return'.
+    DATASTREAM_ADDRESSES = None
+
     def __init__(self, botengine, parent):
         """
         Instantiate this object
@@ -124,7 +167,39 @@ class Intelligence:
         """
         if hasattr(self, address):
             getattr(self, address)(botengine, content)
-    
+
+    @classmethod
+    def subscribes_to(cls, address):
+        """
+        Determine if this class of microservice wants to receive data stream messages on the given address
+        :param address: Data Stream address
+        :return: True if datastream_updated() should be called for this address
+        """
+        if cls.DATASTREAM_ADDRESSES is not None:
+            return address in cls.DATASTREAM_ADDRESSES
+
+        if cls.datastream_updated is not Intelligence.datastream_updated:
+            # Custom datastream_updated() implementation without declared addresses
+            return cls.implements('datastream_updated')
+
+        return callable(getattr(cls, address, None))
+
+    @classmethod
+    def implements(cls, event_name):
+        """
+        Determine if this class of microservice implements the given event hook.
+        Hooks that are inherited from this base class or overridden with a bare 'return' are not implemented,
+        so the Location can skip calling them. The answer is calculated once per class.
+        :param event_name: Name of the event hook, like 'device_measurements_updated'
+        :return: True if calling the event hook could do something
+        """
+        key = (cls, event_name)
+        if key not in _implemented_hooks:
+            function = getattr(cls, event_name, None)
+            _implemented_hooks[key] = function is not None and not _is_noop(function)
+
+        return _implemented_hooks[key]
+
     def schedule_fired(self, botengine, schedule_id):
         """
         The bot executed on a hard coded schedule specified by our runtime.json file
@@ -211,9 +286,13 @@ class Intelligence:
         * runtime.json should include trigger 2048
         * structure.json should include inside 'pip_install_remotely' a reference to the "lz4" Python package
 
+        The CSV data for each device is bytes. If domain.SPOOL_DATA_REQUESTS is True, it's a datarequest.SpooledCsv instead,
+        which stays in a temporary file until it's accessed. That file is deleted when this execution is done with the
+        reference, so copy out anything you need.
+
         :param botengine: BotEngine environment
         :param reference: Optional reference passed into botengine.request_data(..)
-        :param csv_dict: { device_object: 'csv data string' }
+        :param csv_dict: { device_object: bytes or SpooledCsv }
         """
         return
 
@@ -11,11 +11,18 @@ import pytz
 import datetime
 import utilities.utilities as utilities
 import utilities.analytics as analytics
+import utilities.timestamps as timestamps
 import intelligence.index
 import importlib
 import domain
 from utilities.narrative import Narrative
 
+# Variable name for the version of the location properties we last wrote to the server
+LOCATION_PROPERTIES_VERSION_VARIABLE_NAME = "location_properties_version"
+
+# Data stream address another writer can use to tell us our copy of the location properties is out of date
+LOCATION_PROPERTIES_INVALIDATED_DATASTREAM_ADDRESS = "location_properties_invalidated"
+
 
 class Location:
     """
@@ -56,6 +63,9 @@ class Location:
         # Latest copy of our location properties
         self.location_properties = {}
 
+        # Version of our copy of the location properties, or None if it needs to be downloaded from the server
+        self.properties_version = None
+
         # Narratives we're tracking from various microservices for your location.  { "unique_id" : narrative_object }.
         self.location_narratives = {}
 
@@ -71,6 +81,12 @@ class Location:
         # Daylight setting, populated by the 'daylight' microservice package
         self.is_daylight = None
 
+        # Microservices subscribed to each event and data stream address for this execution
+        self._reset_subscribers()
+
+        # True when microservices were added or removed, so the controller knows to re-index them by intelligence ID
+        self.microservices_changed = True
+
         
     def initialize(self, botengine, initialize_everything=True):
         """
@@ -79,8 +95,16 @@ class Location:
         :param initialize_everything: Default is True. False is used when we're performing advance machine learning edge computing services.
         """
         if initialize_everything:
-            for d in self.devices:
-                self.devices[d].initialize(botengine)
+            if hasattr(self.devices, 'is_loaded'):
+                # Devices still in storage get initialized when they're first accessed. See persistence.LazyDict.
+                self.devices.on_load = lambda device: device.initialize(botengine)
+                for d in self.devices:
+                    if self.devices.is_loaded(d):
+                        self.devices[d].initialize(botengine)
+
+            else:
+                for d in self.devices:
+                    self.devices[d].initialize(botengine)
 
         # for module_name in self.intelligence_modules:
         #     botengine.get_logger().info("{} : {}".format(self.intelligence_modules[module_name].intelligence_id, module_name))
@@ -98,6 +122,7 @@ class Location:
                         botengine.get_logger().info("Adding location microservice: " + str(intelligence_info['module']))
                         intelligence_object = class_(botengine, self)
                         self.intelligence_modules[intelligence_info['module']] = intelligence_object
+                        self.microservices_changed = True
 
                     except Exception as e:
                         import traceback
@@ -116,6 +141,7 @@ class Location:
                     botengine.get_logger().info("Deleting location microservice: " + str(module_name))
                     self.intelligence_modules[module_name].destroy(botengine)
                     del self.intelligence_modules[module_name]
+                    self.microservices_changed = True
                     
         # Location intelligence execution
         for i in self.intelligence_modules:
@@ -123,6 +149,9 @@ class Location:
             if initialize_everything:
                 self.intelligence_modules[i].initialize(botengine)
 
+        # Microservices may have been added or removed, so subscriptions get rebuilt as events arrive
+        self._reset_subscribers()
+
     def new_version(self, botengine):
         """
         New bot version
@@ -130,6 +159,9 @@ class Location:
         """
         botengine.get_logger().info("location: New bot version detected")
 
+        # Someone else may have written our location properties while the previous version was running
+        self.invalidate_location_properties(botengine)
+
         for intelligence_id in self.intelligence_modules:
             self.intelligence_modules[intelligence_id].new_version(botengine)
 
@@ -146,13 +178,16 @@ class Location:
         :param device_object: Device object to track
         """
         self.devices[device_object.device_id] = device_object
+        self.microservices_changed = True
+        self._reset_subscribers()
 
         if hasattr(device_object, "intelligence_modules"):
             for intelligence_id in device_object.intelligence_modules:
-                device_object.intelligence_modules[intelligence_id].device_added(botengine, device_object)
+                if device_object.intelligence_modules[intelligence_id].implements('device_added'):
+                    device_object.intelligence_modules[intelligence_id].device_added(botengine, device_object)
 
-        for intelligence_id in self.intelligence_modules:
-            self.intelligence_modules[intelligence_id].device_added(botengine, device_object)
+        for microservice in self._get_location_subscribers('device_added'):
+            microservice.device_added(botengine, device_object)
 
     def delete_device(self, botengine, device_id):
         """
@@ -170,9 +205,11 @@ class Location:
             device_object.destroy(botengine)
 
             del self.devices[device_id]
+            self.microservices_changed = True
+            self._reset_subscribers()
 
-            for intelligence_id in self.intelligence_modules:
-                self.intelligence_modules[intelligence_id].device_deleted(botengine, device_object)
+            for microservice in self._get_location_subscribers('device_deleted'):
+                microservice.device_deleted(botengine, device_object)
 
     def mode_updated(self, botengine, mode):
         """
@@ -180,15 +217,14 @@ class Location:
         """
         self.mode = mode
         botengine.get_logger().info("location mode_updated(): " + self.mode + " mode.")
-        
-        for intelligence_id in self.intelligence_modules:
-            self.intelligence_modules[intelligence_id].mode_updated(botengine, mode)
+        location_microservices, device_microservices = self._get_subscribers('mode_updated')
+
+        for microservice in location_microservices:
+            microservice.mode_updated(botengine, mode)
 
         # Device intelligence modules
-        for device_id in self.devices:
-            if hasattr(self.devices[device_id], "intelligence_modules"):
-                for intelligence_id in self.devices[device_id].intelligence_modules:
-                    self.devices[device_id].intelligence_modules[intelligence_id].mode_updated(botengine, mode)
+        for microservice in device_microservices:
+            microservice.mode_updated(botengine, mode)
     
     def device_measurements_updated(self, botengine, device_object):
         """
@@ -196,8 +232,8 @@ class Location:
         :param botengine: BotEngine environment
         :param device_object: Device object that was updated
         """
-        for intelligence_id in self.intelligence_modules:
-            self.intelligence_modules[intelligence_id].device_measurements_updated(botengine, device_object)
+        for microservice in self._get_location_subscribers('device_measurements_updated'):
+            microservice.device_measurements_updated(botengine, device_object)
     
     def device_metadata_updated(self, botengine, device_object):
         """
@@ -205,8 +241,8 @@ class Location:
         :param botengine: BotEngine environment
         :param device_object: Device object that was updated
         """
-        for intelligence_id in self.intelligence_modules:
-            self.intelligence_modules[intelligence_id].device_metadata_updated(botengine, device_object)
+        for microservice in self._get_location_subscribers('device_metadata_updated'):
+            microservice.device_metadata_updated(botengine, device_object)
 
     def device_alert(self, botengine, device_object, alert_type, alert_params):
         """
@@ -215,8 +251,8 @@ class Location:
         :param device_object: Device object that sent the alert
         :param alerts_list: List of alerts
         """
-        for intelligence_id in self.intelligence_modules:
-            self.intelligence_modules[intelligence_id].device_alert(botengine, device_object, alert_type, alert_params)
+        for microservice in self._get_location_subscribers('device_alert'):
+            microservice.device_alert(botengine, device_object, alert_type, alert_params)
 
     def question_answered(self, botengine, question):
         """
@@ -224,14 +260,14 @@ class Location:
         :param botengine: BotEngine environment
         :param question: Question object
         """
-        for intelligence_id in self.intelligence_modules:
-            self.intelligence_modules[intelligence_id].question_answered(botengine, question)
-        
+        location_microservices, device_microservices = self._get_subscribers('question_answered')
+
+        for microservice in location_microservices:
+            microservice.question_answered(botengine, question)
+
         # Device intelligence modules
-        for device_id in self.devices:
-            if hasattr(self.devices[device_id], "intelligence_modules"):
-                for intelligence_id in self.devices[device_id].intelligence_modules:
-                    self.devices[device_id].intelligence_modules[intelligence_id].question_answered(botengine, question)
+        for microservice in device_microservices:
+            microservice.question_answered(botengine, question)
     
     
     def datastream_updated(self, botengine, address, content):
@@ -241,40 +277,153 @@ class Location:
         :param address: Data Stream address
         :param content: Data Stream content
         """
-        for intelligence_id in self.intelligence_modules:
+        if address == LOCATION_PROPERTIES_INVALIDATED_DATASTREAM_ADDRESS:
+            self.invalidate_location_properties(botengine)
+
+        location_microservices, device_microservices = self._get_datastream_subscribers(address)
+
+        for microservice in location_microservices:
             try:
-                self.intelligence_modules[intelligence_id].datastream_updated(botengine, address, content)
+                microservice.datastream_updated(botengine, address, content)
             except Exception as e:
                 botengine.get_logger().warning("location.py - Error delivering datastream message to location microservice (continuing execution): " + str(e))
                 import traceback
                 botengine.get_logger().error(traceback.format_exc())
-        
+
         # Device intelligence modules
-        for device_id in self.devices:
-            if hasattr(self.devices[device_id], "intelligence_modules"):
-                for intelligence_id in self.devices[device_id].intelligence_modules:
+        for microservice in device_microservices:
+            try:
+                microservice.datastream_updated(botengine, address, content)
+            except Exception as e:
+                botengine.get_logger().warning("location.py - Error delivering datastream message to device microservice (continuing execution): " + str(e))
+                import traceback
+                botengine.get_logger().error(traceback.format_exc())
+
+    def location_datastream_updated(self, botengine, address, content):
+        """
+        Deliver a data stream message internally to location microservices only.
+        Devices aren't touched, so devices that are loaded lazily stay in storage.
+        :param botengine: BotEngine environment
+        :param address: Data Stream address
+        :param content: Data Stream content
+        """
+        location_microservices = self._find_subscribers(('location', 'datastream', address), lambda microservice: microservice.subscribes_to(address))
+
+        for microservice in location_microservices:
+            try:
+                microservice.datastream_updated(botengine, address, content)
+            except Exception as e:
+                botengine.get_logger().warning("location.py - Error delivering datastream message to location microservice (continuing execution): " + str(e))
+                import traceback
+                botengine.get_logger().error(traceback.format_exc())
+
+    def _reset_subscribers(self):
+        """
+        Internal method to forget which microservices subscribe to each event and data stream address.
+        Call this whenever microservices or devices get added or removed, and the subscriptions get rebuilt as events arrive.
+        """
+        # Microservices subscribed to each event hook or data stream address. { ('device', 'event', 'mode_updated'): [microservices] }
+        self._subscribers = {}
+
+    def _get_subscribers(self, event_name):
+        """
+        Internal method to find the microservices that implement the given event hook, so we can skip the rest.
+        :param event_name: Name of the event hook in intelligence.py, like 'mode_updated'
+        :return: ( [location_microservices], [device_microservices] )
+        """
+        condition = lambda microservice: microservice.implements(event_name)
+        return (self._find_subscribers(('location', 'event', event_name), condition),
+                self._find_subscribers(('device', 'event', event_name), condition))
+
+    def _get_location_subscribers(self, event_name):
+        """
+        Internal method to find only the location microservices that implement the given event hook.
+        This doesn't touch any devices, so devices that are loaded lazily stay in storage.
+        :param event_name: Name of the event hook in intelligence.py, like 'device_measurements_updated'
+        :return: [location_microservices]
+        """
+        return self._find_subscribers(('location', 'event', event_name), lambda microservice: microservice.implements(event_name))
+
+    def _get_datastream_subscribers(self, address):
+        """
+        Internal method to find the microservices that listen to the given data stream address.
+        :param address: Data Stream address
+        :return: ( [location_microservices], [device_microservices] )
+        """
+        condition = lambda microservice: microservice.subscribes_to(address)
+        return (self._find_subscribers(('location', 'datastream', address), condition),
+                self._find_subscribers(('device', 'datastream', address), condition))
+
+    def _find_subscribers(self, key, condition):
+        """
+        Internal method to find all location or device microservices that satisfy the given condition.
+        The result is cached until microservices or devices get added or removed.
+        The condition must also work when it's given a microservice class instead of an object, so devices that are
+        still in storage can be skipped without loading them.
+        :param key: Cache key, where the first element is 'location' or 'device'. For example: ('device', 'event', 'mode_updated')
+        :param condition: Function that takes a microservice object and returns True if the microservice should be included
+        :return: [microservices]
+        """
+        if not hasattr(self, '_subscribers'):
+            self._reset_subscribers()
+
+        if key not in self._subscribers:
+            microservices = []
+            if key[0] == 'device':
+                for device_id in list(self.devices):
+                    if hasattr(self.devices, 'is_loaded') and not self.devices.is_loaded(device_id):
+                        # Devices still in storage only get loaded if one of their classes of microservices is interested
+                        classes = self.devices.get_microservice_classes(device_id)
+                        if classes is not None and not any(condition(class_) for class_ in classes):
+                            continue
+
                     try:
-                        self.devices[device_id].intelligence_modules[intelligence_id].datastream_updated(botengine, address, content)
-                    except Exception as e:
-                        botengine.get_logger().warning("location.py - Error delivering datastream message to device microservice (continuing execution): " + str(e))
-                        import traceback
-                        botengine.get_logger().error(traceback.format_exc())
-            
+                        device_object = self.devices[device_id]
+
+                    except KeyError:
+                        # Missing from storage and couldn't be replaced
+                        continue
+
+                    if hasattr(device_object, "intelligence_modules"):
+                        for intelligence_id in device_object.intelligence_modules:
+                            if condition(device_object.intelligence_modules[intelligence_id]):
+                                microservices.append(device_object.intelligence_modules[intelligence_id])
+
+            else:
+                for intelligence_id in self.intelligence_modules:
+                    if condition(self.intelligence_modules[intelligence_id]):
+                        microservices.append(self.intelligence_modules[intelligence_id])
+
+            self._subscribers[key] = microservices
+
+        return self._subscribers[key]
+
+    def __getstate__(self):
+        """
+        Don't save microservice subscriptions or the cached timezone, they get rebuilt as they're needed
+        :return: State of this object to save
+        """
+        state = self.__dict__.copy()
+        state.pop('_subscribers', None)
+        state.pop('_timezone', None)
+        return state
+
+
     def schedule_fired(self, botengine, schedule_id):
         """
         Schedule Fired.
         It is this location's responsibility to notify all sub-intelligence modules, including both device and location intelligence modules
         :param botengine: BotEngine environment
         """
+        location_microservices, device_microservices = self._get_subscribers('schedule_fired')
+
         # Location intelligence modules
-        for intelligence_id in self.intelligence_modules:
-            self.intelligence_modules[intelligence_id].schedule_fired(botengine, schedule_id)
-        
+        for microservice in location_microservices:
+            microservice.schedule_fired(botengine, schedule_id)
+
         # Device intelligence modules
-        for device_id in self.devices:
-            if hasattr(self.devices[device_id], "intelligence_modules"):
-                for intelligence_id in self.devices[device_id].intelligence_modules:
-                    self.devices[device_id].intelligence_modules[intelligence_id].schedule_fired(botengine, schedule_id)
+        for microservice in device_microservices:
+            microservice.schedule_fired(botengine, schedule_id)
         
     def timer_fired(self, botengine, argument):
         """
@@ -294,8 +443,8 @@ class Location:
         :param content_type: The content type, for example 'video/mp4'
         :param file_extension: The file extension, for example 'mp4'
         """
-        for intelligence_id in self.intelligence_modules:
-            self.intelligence_modules[intelligence_id].file_uploaded(botengine, device_object, file_id, filesize_bytes, content_type, file_extension)
+        for microservice in self._get_location_subscribers('file_uploaded'):
+            microservice.file_uploaded(botengine, device_object, file_id, filesize_bytes, content_type, file_extension)
 
     def user_role_updated(self, botengine, user_id, category, location_access, previous_category, previous_location_access):
         """
@@ -308,15 +457,15 @@ class Location:
         :param previous_category: User's previous category, if any
         :param previous_location_access: User's previous access to the location, if any
         """
+        location_microservices, device_microservices = self._get_subscribers('user_role_updated')
+
         # Location intelligence modules
-        for intelligence_id in self.intelligence_modules:
-            self.intelligence_modules[intelligence_id].user_role_updated(botengine, user_id, category, location_access, previous_category, previous_location_access)
+        for microservice in location_microservices:
+            microservice.user_role_updated(botengine, user_id, category, location_access, previous_category, previous_location_access)
 
         # Device intelligence modules
-        for device_id in self.devices:
-            if hasattr(self.devices[device_id], "intelligence_modules"):
-                for intelligence_id in self.devices[device_id].intelligence_modules:
-                    self.devices[device_id].intelligence_modules[intelligence_id].user_role_updated(botengine, user_id, category, location_access, previous_category, previous_location_access)
+        for microservice in device_microservices:
+            microservice.user_role_updated(botengine, user_id, category, location_access, previous_category, previous_location_access)
 
     def call_center_updated(self, botengine, user_id, status):
         """
@@ -325,15 +474,15 @@ class Location:
         :param user_id: User ID that made the change
         :param status: Current call center status
         """
+        location_microservices, device_microservices = self._get_subscribers('call_center_updated')
+
         # Location intelligence modules
-        for intelligence_id in self.intelligence_modules:
-            self.intelligence_modules[intelligence_id].call_center_updated(botengine, user_id, status)
+        for microservice in location_microservices:
+            microservice.call_center_updated(botengine, user_id, status)
 
         # Device intelligence modules
-        for device_id in self.devices:
-            if hasattr(self.devices[device_id], "intelligence_modules"):
-                for intelligence_id in self.devices[device_id].intelligence_modules:
-                    self.devices[device_id].intelligence_modules[intelligence_id].call_center_updated(botengine, user_id, status)
+        for microservice in device_microservices:
+            microservice.call_center_updated(botengine, user_id, status)
 
     def data_request_ready(self, botengine, reference, device_csv_dict):
         """
@@ -342,10 +491,12 @@ class Location:
         :param reference: Optional reference passed into botengine.request_data(..)
         :param device_csv_dict: { 'device_id': 'csv data string' }
         """
+        location_microservices, device_microservices = self._get_subscribers('data_request_ready')
+
         # Location microservices
-        for intelligence_id in self.intelligence_modules:
+        for microservice in location_microservices:
             try:
-                self.intelligence_modules[intelligence_id].data_request_ready(botengine, reference, device_csv_dict)
+                microservice.data_request_ready(botengine, reference, device_csv_dict)
             except Exception as e:
                 botengine.get_logger().warning("location.py - Error delivering data_request_ready to location microservice : " + str(e))
                 import traceback
@@ -353,15 +504,13 @@ class Location:
 
 
         # Device microservices
-        for device_id in self.devices:
-            if hasattr(self.devices[device_id], "intelligence_modules"):
-                for intelligence_id in self.devices[device_id].intelligence_modules:
-                    try:
-                        self.devices[device_id].intelligence_modules[intelligence_id].data_request_ready(botengine, reference, device_csv_dict)
-                    except Exception as e:
-                        botengine.get_logger().warning("location.py - Error delivering data_request_ready to device microservice : " + str(e))
-                        import traceback
-                        botengine.get_logger().error(traceback.format_exc())
+        for microservice in device_microservices:
+            try:
+                microservice.data_request_ready(botengine, reference, device_csv_dict)
+            except Exception as e:
+                botengine.get_logger().warning("location.py - Error delivering data_request_ready to device microservice : " + str(e))
+                import traceback
+                botengine.get_logger().error(traceback.format_exc())
 
     def update_coordinates(self, botengine, latitude, longitude):
         """
@@ -379,9 +528,9 @@ class Location:
             self.latitude = latitude
             self.longitude = longitude
 
-            for intelligence_id in self.intelligence_modules:
+            for microservice in self._get_location_subscribers('coordinates_updated'):
                 try:
-                    self.intelligence_modules[intelligence_id].coordinates_updated(botengine, self.latitude, self.longitude)
+                    microservice.coordinates_updated(botengine, self.latitude, self.longitude)
                 except Exception as e:
                     botengine.get_logger().warning("location.py - Error delivering coordinates_updated to location microservice : " + str(e))
                     import traceback
@@ -443,60 +592,63 @@ class Location:
         :param last_reason: Last reason
         :return:
         """
-        for intelligence_id in self.intelligence_modules:
+        location_microservices, device_microservices = self._get_subscribers('occupancy_status_updated')
+
+        for microservice in location_microservices:
             try:
-                self.intelligence_modules[intelligence_id].occupancy_status_updated(botengine, status, reason, last_status, last_reason)
+                microservice.occupancy_status_updated(botengine, status, reason, last_status, last_reason)
             except Exception as e:
                 botengine.get_logger().warning("location.py - Error delivering occupancy_status_updated to location microservice (continuing execution): " + str(e))
                 import traceback
                 botengine.get_logger().error(traceback.format_exc())
 
         # Device intelligence modules
-        for device_id in self.devices:
-            if hasattr(self.devices[device_id], "intelligence_modules"):
-                for intelligence_id in self.devices[device_id].intelligence_modules:
-                    try:
-                        self.devices[device_id].intelligence_modules[intelligence_id].occupancy_status_updated(botengine, status, reason, last_status, last_reason)
-                    except Exception as e:
-                        botengine.get_logger().warning("location.py - Error delivering occupancy_status_updated message to device microservice (continuing execution): " + str(e))
-                        import traceback
-                        botengine.get_logger().error(traceback.format_exc())
+        for microservice in device_microservices:
+            try:
+                microservice.occupancy_status_updated(botengine, status, reason, last_status, last_reason)
+            except Exception as e:
+                botengine.get_logger().warning("location.py - Error delivering occupancy_status_updated message to device microservice (continuing execution): " + str(e))
+                import traceback
+                botengine.get_logger().error(traceback.format_exc())
 
     #===========================================================================
     # Location Properties
     #===========================================================================
     def set_location_property(self, botengine, property_name, property_value, track=True):
         """
-        Set a location property
+        Set a location property.
+        The change is written back to the server along with all other property changes at the end of the execution.
+
         :param botengine: BotEngine environment
         :param property_name: Property name
         :param property_value: Property value
         :param track: True to automatically copy these properties to the 3rd party analytics (default is True
         """
-        self._sync_location_properties(botengine)
-        self.location_properties[property_name] = property_value
-        botengine.set_ui_content('location_properties', self.location_properties)
-
-        if track:
-            import utilities.analytics as analytics
-            analytics.people_set(botengine, self, {property_name: property_value})
+        self.update_location_properties(botengine, {property_name: property_value}, track=track)
 
     def update_location_properties(self, botengine, properties_dict, track=True):
         """
         Update multiple location properties simultaneously from a dictionary.
         If the properties don't exist yet, they will be added.
 
+        The change is written back to the server along with all other property changes at the end of the execution.
+
         :param botengine: BotEngine environment
         :param properties_dict: Properties dictionary with key/values to update
         :param track: True to automatically copy these properties to the 3rd party analytics (default is True)
         """
         self._sync_location_properties(botengine)
         self.location_properties.update(properties_dict)
-        botengine.set_ui_content('location_properties', self.location_properties)
+        for property_name in properties_dict:
+            self._location_properties_changed(property_name)
+
+        people_increment = self._get_properties_people_increment()
+        for property_name in properties_dict:
+            # The new value replaces anything we incremented earlier in this execution
+            people_increment.pop(property_name, None)
 
         if track:
-            import utilities.analytics as analytics
-            analytics.people_set(botengine, self, properties_dict)
+            self._get_properties_people_set().update(properties_dict)
 
     def increment_location_property(self, botengine, property_name, increment_amount=1, track=True):
         """
@@ -505,6 +657,8 @@ class Location:
         If the property doesn't exist, it will be initialized to 0 and then incremented by the amount given.
         An existing property must be numeric to increment.
 
+        The change is written back to the server along with all other property changes at the end of the execution.
+
         :param botengine: BotEngine environment
         :param property_name: Property name to increment
         :param increment_amount: Incremental amount to add (default is 1)
@@ -515,10 +669,16 @@ class Location:
             self.location_properties[property_name] = 0
 
         self.location_properties[property_name] += increment_amount
-        botengine.set_ui_content('location_properties', self.location_properties)
+        self._location_properties_changed(property_name, increment_amount)
 
-        import utilities.analytics as analytics
-        analytics.people_increment(botengine, self, {property_name: increment_amount})
+        people_set = self._get_properties_people_set()
+        if property_name in people_set:
+            # We're already setting this property in the analytics, so set its latest value instead
+            people_set[property_name] = self.location_properties[property_name]
+
+        else:
+            people_increment = self._get_properties_people_increment()
+            people_increment[property_name] = people_increment.get(property_name, 0) + increment_amount
 
     def get_location_property(self, botengine, property_name):
         """
@@ -540,8 +700,10 @@ class Location:
         """
         self._sync_location_properties(botengine)
         if property_name in self.location_properties:
-            del(self.location_propertyes[property_name])
-            botengine.set_ui_content('location_properties', self.location_properties)
+            del(self.location_properties[property_name])
+            self._get_properties_people_set().pop(property_name, None)
+            self._get_properties_people_increment().pop(property_name, None)
+            self._location_properties_changed(property_name, deleted=True)
 
     def set_location_property_separately(self, botengine, additional_property_name, additional_property_json, overwrite=False, timestamp_ms=None):
         """
@@ -582,20 +744,160 @@ class Location:
 
         botengine.set_ui_content(additional_property_name, additional_property_json, overwrite=overwrite, timestamp_ms=timestamp_ms)
 
+    def flush_location_properties(self, botengine):
+        """
+        Write back all the location property changes from this execution to the server with a single set_ui_content(),
+        and copy them to the 3rd party analytics with a single people_set and people_increment.
+        The bot calls this at the end of each execution, right before analytics are flushed and variables are saved.
+
+        Microservices that buffer content stored with set_location_property_separately() receive a
+        'location_properties_flush' data stream message first, so they can write it back in time.
+
+        If our copy was invalidated after we changed it, the server's copy is downloaded again and our changes are
+        applied on top of it, so we don't overwrite what someone else wrote in the meantime.
+
+        :param botengine: BotEngine environment
+        """
+        self.location_datastream_updated(botengine, "location_properties_flush", None)
+
+        if not getattr(self, '_properties_dirty', False):
+            return
+
+        changes = self._get_properties_changes()
+        self._properties_changes = {}
+        self._properties_dirty = False
+
+        if self.properties_version is None:
+            # Invalidated while we had changes the server hasn't seen yet
+            local_properties = self.location_properties
+            self.properties_timestamp_ms = 0
+            self._sync_location_properties(botengine)
+
+            for property_name in changes:
+                if changes[property_name] == 'set':
+                    self.location_properties[property_name] = local_properties[property_name]
+
+                elif changes[property_name] == 'delete':
+                    self.location_properties.pop(property_name, None)
+
+                else:
+                    self.location_properties[property_name] = self.location_properties.get(property_name, 0) + changes[property_name]
+
+        botengine.set_ui_content('location_properties', self.location_properties)
+
+        # Core variables aren't saved on every trigger, so the version we wrote is kept in its own variable.
+        # If this object doesn't get saved, the next execution sees its version is behind and downloads a fresh copy.
+        self.properties_version = (botengine.load_variable(LOCATION_PROPERTIES_VERSION_VARIABLE_NAME) or 0) + 1
+        botengine.save_variable(LOCATION_PROPERTIES_VERSION_VARIABLE_NAME, self.properties_version, required_for_each_execution=True)
+
+        people_set = self._get_properties_people_set()
+        people_increment = self._get_properties_people_increment()
+        self._properties_people_set = {}
+        self._properties_people_increment = {}
+
+        import utilities.analytics as analytics
+        if len(people_set) > 0:
+            analytics.people_set(botengine, self, people_set)
+
+        if len(people_increment) > 0:
+            analytics.people_increment(botengine, self, people_increment)
+
+    def invalidate_location_properties(self, botengine):
+        """
+        Forget our copy of the location properties, so they get downloaded from the server the next time they're accessed.
+        Changes we haven't written back yet are kept.
+        :param botengine: BotEngine environment
+        """
+        botengine.get_logger().info("location: Location properties invalidated")
+        self.properties_version = None
+        self.properties_timestamp_ms = 0
+
+    def _location_properties_changed(self, property_name, increment_amount=None, deleted=False):
+        """
+        Internal method to remember a location property needs to be written back to the server
+        :param property_name: Property name that changed
+        :param increment_amount: Amount the property was incremented by, or None if it was set
+        :param deleted: True if the property was deleted
+        """
+        self._properties_dirty = True
+
+        changes = self._get_properties_changes()
+        if deleted:
+            changes[property_name] = 'delete'
+
+        elif increment_amount is None or changes.get(property_name) in ['set', 'delete']:
+            # Incrementing a property we set or deleted earlier in this execution still means we know its value
+            changes[property_name] = 'set'
+
+        else:
+            changes[property_name] = changes.get(property_name, 0) + increment_amount
+
+    def _get_properties_changes(self):
+        """
+        Internal method to get the location properties we changed since they were last written back to the server
+        :return: { 'property_name': 'set', 'delete', or the total amount it was incremented by }
+        """
+        if getattr(self, '_properties_changes', None) is None:
+            self._properties_changes = {}
+        return self._properties_changes
+
+    def _get_properties_people_set(self):
+        """
+        Internal method to get the location properties to set in the analytics when they're flushed
+        :return: { 'property_name': value }
+        """
+        if getattr(self, '_properties_people_set', None) is None:
+            self._properties_people_set = {}
+        return self._properties_people_set
+
+    def _get_properties_people_increment(self):
+        """
+        Internal method to get the location properties to increment in the analytics when they're flushed
+        :return: { 'property_name': increment_amount }
+        """
+        if getattr(self, '_properties_people_increment', None) is None:
+            self._properties_people_increment = {}
+        return self._properties_people_increment
+
     def _sync_location_properties(self, botengine):
         """
-        Internal method to synchornize our local copy of location properties with the server
+        Internal method to synchornize our local copy of location properties with the server.
+
+        This bot is the only one writing its location properties, so our copy stays authoritative as long as its version
+        matches the version we last wrote. That check is once per execution and reads a variable that comes with the
+        execution, so the server is only asked for the location properties when something else may have changed them.
+
         :param botengine: BotEngine environment
         """
-        if self.properties_timestamp_ms != botengine.get_timestamp():
-            properties = botengine.get_ui_content('location_properties')
-            if properties is not None:
-                self.location_properties = properties
+        if getattr(self, '_properties_dirty', False):
+            # Our local copy has changes the server hasn't seen yet
+            return
 
-            else:
-                self.location_properties = {}
+        if self.properties_timestamp_ms == botengine.get_timestamp():
+            return
+
+        self.properties_timestamp_ms = botengine.get_timestamp()
 
-            self.properties_timestamp_ms = botengine.get_timestamp()
+        # Added October 17, 2026
+        if not hasattr(self, 'properties_version'):
+            self.properties_version = None
+
+        version = botengine.load_variable(LOCATION_PROPERTIES_VERSION_VARIABLE_NAME)
+        if self.properties_version is not None and self.properties_version == version:
+            return
+
+        properties = botengine.get_ui_content('location_properties')
+        if properties is not None:
+            self.location_properties = properties
+
+        else:
+            self.location_properties = {}
+
+        if version is None:
+            version = 0
+            botengine.save_variable(LOCATION_PROPERTIES_VERSION_VARIABLE_NAME, version, required_for_each_execution=True)
+
+        self.properties_version = version
 
     #===========================================================================
     # Data Stream Message delivery
@@ -1053,7 +1355,34 @@ class Location:
         :param botengine: BotEngine environment
         :param timestamp_ms: Timestamp in milliseconds to transform into a timezone-aware datetime object
         """
-        return datetime.datetime.fromtimestamp(timestamp_ms / 1000.0, pytz.timezone(self.get_local_timezone_string(botengine)))
+        return timestamps.timestamp_ms_to_datetime(timestamp_ms, self.get_local_timezone(botengine))
+
+    def get_local_timezone(self, botengine):
+        """
+        Get the local timezone.
+        The timezone is resolved once for each location info block, so it gets resolved again when the location info changes.
+        :param botengine: BotEngine environment
+        :return: tzinfo
+        """
+        location_block = botengine.get_location_info()
+        cached = getattr(self, '_timezone', None)
+        if cached is None or cached[0] is not location_block:
+            cached = (location_block, pytz.timezone(self.get_local_timezone_string(botengine)))
+            self._timezone = cached
+
+        return cached[1]
+
+    def get_local_hours_and_days(self, botengine, timestamps_ms):
+        """
+        Convert many timestamps at once into local machine learning features, like get_local_hour_of_day() and get_local_day_of_week().
+        This requires numpy.
+        :param botengine: BotEngine environment
+        :param timestamps_ms: Array of timestamps in milliseconds
+        :return: (NumPy float64 array of relative hours of the day 0.0 - 23.99, NumPy int64 array of days of the week 0 = Monday through 6 = Sunday)
+        """
+        import utilities.features as features
+        local_ms = features.get_local_milliseconds(timestamps_ms, self.get_local_timezone(botengine))
+        return features.get_hours_of_day(local_ms), features.get_days_of_week(local_ms)
         
     def get_local_timezone_string(self, botengine):
         """
@@ -1131,8 +1460,7 @@ class Location:
         :param dt: Datetime to convert to unix timestamp
         :return: timestamp in milliseconds
         """
-        from tzlocal import get_localzone
-        return int((dt.astimezone(get_localzone())).strftime("%s")) * 1000
+        return timestamps.datetime_to_timestamp_ms(dt)
 
     def get_local_hour_of_day(self, botengine):
         """
@@ -1182,16 +1510,15 @@ class Location:
     #===========================================================================
     # CSV methods for machine learning algorithm integrations
     #===========================================================================
-    def get_csv(self, botengine, oldest_timestamp_ms=None, newest_timestamp_ms=None):
+    def get_csv(self, botengine, oldest_timestamp_ms=None, newest_timestamp_ms=None, output_file=None):
         """
         Get a .csv string of all the data
         :param botengine: BotEngine environment
         :param oldest_timestamp_ms: oldest timestamp in milliseconds
         :param newest_timestamp_ms: newest timestamp in milliseconds
-        :return: .csv string, largely matching the .csv data you would receive from the "botengine --download_device [device_id]" command line interface. Or None if this device doesn't have data.
+        :param output_file: Optional file-like object to stream the .csv data into, instead of building a string
+        :return: .csv string, largely matching the .csv data you would receive from the "botengine --download_device [device_id]" command line interface. Or the output_file if one was given. Or None if this device doesn't have data.
         """
-        output = "location_id,timestamp_ms,timestamp_iso,event,source_type\n"
-
         # This number happens to be the oldest timestamp
         if oldest_timestamp_ms < 1262304000000:
             oldest_timestamp_ms = 1262304000000
@@ -1209,14 +1536,18 @@ class Location:
             return None
 
         botengine.get_logger().info("{} mode changes captured".format(len(modes['events'])))
+        return utilities.write_lines(self._csv_lines(botengine, modes['events']), output_file)
 
-        for event in modes['events']:
-            timestamp_ms = event['eventDateMs']
-            dt = self.get_local_datetime_from_timestamp(botengine, timestamp_ms)
+    def _csv_lines(self, botengine, events):
+        """
+        Internal generator of .csv lines for get_csv()
+        :param botengine: BotEngine environment
+        :param events: Mode history events
+        """
+        yield "location_id,timestamp_ms,timestamp_iso,event,source_type\n"
 
+        formatter = utilities.IsoFormatter(self.get_local_timezone(botengine))
+        for event in events:
+            timestamp_ms = event['eventDateMs']
             event_name = event['event'].replace(",",".")
-
-            output += "{},{},{},{},{}".format(self.location_id, timestamp_ms, utilities.iso_format(dt), event_name, event['sourceType'])
-            output += "\n"
-
-        return output
+            yield "{},{},{},{},{}\n".format(self.location_id, timestamp_ms, formatter.format(timestamp_ms), event_name, event['sourceType'])
@@ -0,0 +1,487 @@
+'''
+Created on October 17, 2026
+
+This file is subject to the terms and conditions defined in the
+file 'LICENSE.txt', which is part of this source code package.
+
+@author: David Moss
+'''
+
+import io
+import hashlib
+import weakref
+
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+
+import dill
+
+# Name of the variable that holds the manifest. Older bots stored the entire Controller object graph here.
+MANIFEST_VARIABLE_NAME = "controller"
+
+# Every location, device, and microservice object is stored under its own variable name with this prefix
+VARIABLE_PREFIX = "controller."
+
+# Version of the manifest format
+MANIFEST_VERSION = 2
+
+# Stores that loaded each controller in this execution. { controller_object: ObjectStore }
+_stores = weakref.WeakKeyDictionary()
+
+
+def load_controller(botengine, lazy=False):
+    """
+    Load the Controller object from non-volatile memory
+    :param botengine: BotEngine environment
+    :param lazy: True to leave each location's devices in storage until they're accessed
+    :return: Controller object, or None if there is no saved controller yet
+    """
+    store = ObjectStore(lazy)
+    controller = store.load(botengine)
+    if controller is not None:
+        _stores[controller] = store
+    return controller
+
+
+def save_controller(botengine, controller):
+    """
+    Save the Controller object to non-volatile memory.
+    Only the locations, devices, and microservices that changed during this execution get uploaded.
+    :param botengine: BotEngine environment
+    :param controller: Controller object
+    """
+    if controller not in _stores:
+        # This is a new controller, maybe because the last one couldn't be loaded. Whatever it stored gets replaced.
+        _stores[controller] = ObjectStore()
+        _stores[controller].load_keys(botengine)
+    _stores[controller].save(botengine, controller)
+
+
+def object_key(obj):
+    """
+    Get the key this object is stored under, if it is stored separately from the object that references it
+    :param obj: Any object
+    :return: Key like 'device.1234', or None if this object is serialized inline with its parent
+    """
+    # Imported here because these modules import the bot's object model, which in turn imports this module
+    from locations.location import Location
+    from devices.device import Device
+    from intelligence.intelligence import Intelligence
+
+    if isinstance(obj, Location):
+        return "location.{}".format(obj.location_id)
+
+    elif isinstance(obj, Device):
+        return "device.{}".format(obj.device_id)
+
+    elif isinstance(obj, Intelligence):
+        return "microservice.{}".format(obj.intelligence_id)
+
+    return None
+
+
+class ObjectStore:
+    """
+    Split the Controller object graph across many variables, one per location, device, and microservice.
+
+    Each stored object is serialized with dill, but references to other stored objects are written as their key
+    instead of a copy of the object. On load, references are resolved back to the same object, so shared references
+    stay shared. Every object that was loaded remembers the digest of its bytes, and only objects whose bytes changed
+    get saved again.
+
+    Each location's dictionary of devices is stored as a list of keys. In lazy mode, it loads as a LazyDict so
+    devices are only deserialized when they're accessed. Devices that were never loaded are kept as they are.
+
+    Only the manifest comes with every execution. The objects a load needs right away are downloaded together in
+    one request, and devices in lazy mode are downloaded one at a time as they're accessed.
+    """
+
+    def __init__(self, lazy=False):
+        """
+        Constructor
+        :param lazy: True to leave each location's devices in storage until they're accessed
+        """
+        # True to leave each location's devices in storage until they're accessed
+        self.lazy = lazy
+
+        # Objects loaded in this execution. { 'key': object }
+        self.objects = {}
+
+        # Digest of each stored object as it was loaded or last saved. { 'key': 'digest' }
+        self.digests = {}
+
+        # Keys that are stored in non-volatile memory, and the keys each one references. { 'key': ['referenced_key'] }
+        self.refs = {}
+
+        # BotEngine environment used to load objects as they get referenced
+        self.botengine = None
+
+        # Objects downloaded ahead of time that haven't been deserialized yet. { 'key': bytes }
+        self.blobs = {}
+
+    def load(self, botengine):
+        """
+        Load the controller and the objects it references
+        :param botengine: BotEngine environment
+        :return: Controller object, or None if it doesn't exist
+        """
+        from controller import Controller
+
+        manifest = botengine.load_variable(MANIFEST_VARIABLE_NAME)
+        if manifest is None:
+            return None
+
+        if isinstance(manifest, Controller):
+            # Legacy storage of the entire object graph in one variable. Everything gets saved on the next save().
+            botengine.get_logger().info("persistence: Migrating the controller to split storage")
+            return manifest
+
+        if manifest['version'] < 2:
+            # Version 1 didn't record references between objects, so nothing can stay in storage until the next save()
+            self.refs = dict((key, []) for key in manifest['keys'])
+            self.lazy = False
+
+        else:
+            self.refs = manifest['keys']
+
+        self.botengine = botengine
+        self._prefetch(botengine)
+        return self._deserialize(None, manifest['controller'])
+
+    def _prefetch(self, botengine):
+        """
+        Download every object the controller needs right away in a single request.
+        In lazy mode that's the locations and everything they reference, except for devices.
+        :param botengine: BotEngine environment
+        """
+        if self.lazy:
+            keys = set()
+            pending = [key for key in self.refs if key.startswith("location.")]
+            while len(pending) > 0:
+                key = pending.pop()
+                if key not in keys and not key.startswith("device."):
+                    keys.add(key)
+                    pending += self.refs.get(key, [])
+
+        else:
+            keys = set(self.refs.keys())
+
+        if len(keys) == 0:
+            return
+
+        blobs = botengine.load_variables([VARIABLE_PREFIX + key for key in keys])
+        for key in keys:
+            if blobs.get(VARIABLE_PREFIX + key) is not None:
+                self.blobs[key] = blobs[VARIABLE_PREFIX + key]
+
+    def load_keys(self, botengine):
+        """
+        Learn which objects are already stored, without loading any of them, so the next save() deletes the ones
+        that aren't referenced anymore.
+        :param botengine: BotEngine environment
+        """
+        try:
+            manifest = botengine.load_variable(MANIFEST_VARIABLE_NAME)
+            if isinstance(manifest, dict) and 'keys' in manifest:
+                self.refs = dict((key, []) for key in manifest['keys'])
+
+        except Exception as e:
+            import traceback
+            botengine.get_logger().warning("persistence: Could not read the existing manifest: {}; {}".format(str(e), traceback.format_exc()))
+
+    def save(self, botengine, controller):
+        """
+        Save the controller and all the objects it references that have changed
+        :param botengine: BotEngine environment
+        :param controller: Controller object
+        """
+        blobs = {}
+        refs = {}
+        pending = []
+        controller_blob, controller_refs = self._serialize(controller, pending)
+
+        while len(pending) > 0:
+            key, obj = pending.pop()
+            if key not in blobs:
+                blobs[key], refs[key] = self._serialize(obj, pending)
+
+        # Objects that were never loaded are still stored, along with everything they reference
+        unloaded = [key for key in controller_refs if key not in blobs]
+        for key in refs:
+            unloaded += [ref for ref in refs[key] if ref not in blobs]
+
+        while len(unloaded) > 0:
+            key = unloaded.pop()
+            if key not in refs and key in self.refs:
+                refs[key] = self.refs[key]
+                unloaded += [ref for ref in refs[key] if ref not in blobs]
+
+        saved = 0
+        for key in blobs:
+            digest = hashlib.sha1(blobs[key]).hexdigest()
+            if self.digests.get(key) != digest:
+                botengine.save_variable(VARIABLE_PREFIX + key, blobs[key], required_for_each_execution=False)
+                self.digests[key] = digest
+                saved += 1
+
+        for key in self.refs:
+            if key not in refs:
+                botengine.delete_variable(VARIABLE_PREFIX + key)
+                self.digests.pop(key, None)
+
+        self.refs = refs
+
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'controller': controller_blob,
+            'keys': refs
+        }
+        botengine.save_variable(MANIFEST_VARIABLE_NAME, manifest, required_for_each_execution=True)
+        botengine.get_logger().info("persistence: Saved {} of {} objects".format(saved, len(refs)))
+
+    def resolve(self, key):
+        """
+        Get the stored object with the given key, loading it if necessary
+        :param key: Key of the object
+        :return: Object
+        """
+        if key not in self.objects:
+            blob = self.blobs.pop(key, None)
+            if blob is None:
+                blob = self.botengine.load_variable(VARIABLE_PREFIX + key)
+
+            if blob is None:
+                raise MissingObjectError("persistence: Missing stored object '{}'".format(key))
+
+            self.digests[key] = hashlib.sha1(blob).hexdigest()
+            self._deserialize(key, blob)
+
+        return self.objects[key]
+
+    def _serialize(self, obj, pending):
+        """
+        Serialize one object. Other stored objects it references are added to the pending list instead.
+        :param obj: Object to serialize
+        :param pending: List of (key, object) tuples that still need to be serialized
+        :return: (bytes, ['referenced_key'])
+        """
+        if hasattr(obj, '__getstate__'):
+            state = obj.__getstate__()
+        else:
+            state = obj.__dict__
+
+        from locations.location import Location
+        if isinstance(obj, Location) and isinstance(state.get('devices'), dict):
+            # Store the devices as a list of keys, so they can be loaded lazily
+            state = dict(state)
+            state['devices'] = LazyDict(self, state['devices'])
+
+        f = io.BytesIO()
+        dill.dump(obj.__class__, f)
+        pickler = _Pickler(f, obj, pending)
+        pickler.dump(state)
+        return f.getvalue(), pickler.refs
+
+    def _deserialize(self, key, blob):
+        """
+        Deserialize one object. The empty object is registered before its state loads, so circular references resolve.
+        :param key: Key of the object, or None for the controller
+        :param blob: bytes
+        :return: Object
+        """
+        f = io.BytesIO(blob)
+        class_ = dill.load(f)
+        obj = class_.__new__(class_)
+        if key is not None:
+            self.objects[key] = obj
+
+        state = _Unpickler(f, self).load()
+        if hasattr(obj, '__setstate__'):
+            obj.__setstate__(state)
+        else:
+            obj.__dict__.update(state)
+
+        return obj
+
+
+class MissingObjectError(KeyError):
+    """
+    A stored object is referenced, but its variable doesn't exist anymore
+    """
+    pass
+
+
+class LazyDict(MutableMapping):
+    """
+    Dictionary of stored objects, where each object is only loaded from storage the first time it's accessed.
+    Checking membership, counting, and iterating over the keys don't load anything.
+
+    The classes of each object's microservices are stored along with its key, so we can tell which microservices
+    an object has without loading it.
+    """
+
+    def __init__(self, store, data):
+        """
+        Constructor
+        :param store: ObjectStore that loads objects
+        :param data: Dictionary of objects, where objects still in storage are represented by a _Reference
+        """
+        self.store = store
+        self.data = data
+
+        # Function to call with each object right after it's loaded
+        self.on_load = None
+
+        # Function to call with the dictionary key of an object whose variable is missing. It returns a replacement object, or None.
+        self.on_missing = None
+
+    def is_loaded(self, name):
+        """
+        :param name: Dictionary key
+        :return: True if the object for this dictionary key is loaded
+        """
+        return not isinstance(self.data[name], _Reference)
+
+    def get_microservice_classes(self, name):
+        """
+        Get the classes of an object's microservices, without loading the object
+        :param name: Dictionary key
+        :return: List of microservice classes, or None if they aren't known
+        """
+        value = self.data[name]
+        if not isinstance(value, _Reference):
+            return [microservice.__class__ for microservice in getattr(value, 'intelligence_modules', {}).values()]
+
+        if value.classes is None:
+            return None
+
+        import importlib
+        classes = []
+        for class_name in value.classes:
+            try:
+                module_name, class_name = class_name.rsplit('.', 1)
+                classes.append(getattr(importlib.import_module(module_name), class_name))
+
+            except Exception:
+                # The microservice doesn't exist anymore, so we can't tell without loading the object
+                return None
+
+        return classes
+
+    def __getitem__(self, name):
+        value = self.data[name]
+        if isinstance(value, _Reference):
+            try:
+                value = self.store.resolve(value.key)
+
+            except MissingObjectError as e:
+                import traceback
+                self.store.botengine.get_logger().error("{}; {}".format(str(e), traceback.format_exc()))
+                del self.data[name]
+                value = None
+                if self.on_missing is not None:
+                    value = self.on_missing(name)
+
+                if value is None:
+                    raise KeyError(name)
+
+                return value
+
+            self.data[name] = value
+            if self.on_load is not None:
+                self.on_load(value)
+
+        return value
+
+    def __setitem__(self, name, value):
+        self.data[name] = value
+
+    def __delitem__(self, name):
+        del self.data[name]
+
+    def __contains__(self, name):
+        return name in self.data
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __repr__(self):
+        return repr(self.data)
+
+
+class _Reference:
+    """
+    Placeholder in a LazyDict for an object that is still in storage
+    """
+    def __init__(self, key, classes=None):
+        self.key = key
+
+        # Names of the object's microservice classes like 'module.ClassName', or None if they aren't known
+        self.classes = classes
+
+
+class _Pickler(dill.Pickler):
+    """
+    Write references to other stored objects as their key
+    """
+    def __init__(self, f, root, pending):
+        dill.Pickler.__init__(self, f)
+        self.root = root
+        self.pending = pending
+
+        # Keys of the stored objects referenced by the root object
+        self.refs = []
+
+    def persistent_id(self, obj):
+        if isinstance(obj, LazyDict):
+            items = []
+            for name in obj.data:
+                if obj.is_loaded(name):
+                    key = self.persistent_id(obj.data[name])
+                    classes = ["{}.{}".format(microservice.__class__.__module__, microservice.__class__.__name__) for microservice in getattr(obj.data[name], 'intelligence_modules', {}).values()]
+                else:
+                    key = obj.data[name].key
+                    classes = obj.data[name].classes
+                    self.refs.append(key)
+                items.append((name, key, classes))
+            return ('lazy', items)
+
+        key = object_key(obj)
+        if key is not None and obj is not self.root:
+            self.pending.append((key, obj))
+            self.refs.append(key)
+        return key
+
+
+class _Unpickler(dill.Unpickler):
+    """
+    Resolve keys back into stored objects
+    """
+    def __init__(self, f, store):
+        dill.Unpickler.__init__(self, f)
+        self.store = store
+
+    def persistent_load(self, pid):
+        if isinstance(pid, tuple):
+            # Dictionary of devices. Manifest version 2 didn't record microservice classes.
+            if self.store.lazy:
+                return LazyDict(self.store, dict((item[0], _Reference(item[1], item[2] if len(item) > 2 else None)) for item in pid[1]))
+
+            devices = {}
+            for item in pid[1]:
+                try:
+                    devices[item[0]] = self.store.resolve(item[1])
+
+                except MissingObjectError as e:
+                    # The device gets created again as a new device when the controller syncs with the access block
+                    import traceback
+                    self.store.botengine.get_logger().error("{}; {}".format(str(e), traceback.format_exc()))
+
+            return devices
+
+        return self.store.resolve(pid)
@@ -7,6 +7,18 @@ file 'LICENSE.txt', which is part of this source code package.
 @author: David Moss
 '''
 
+import threading
+
+# Maximum number of seconds to wait for analytics delivered in the background before the execution ends
+BACKGROUND_JOIN_TIMEOUT_S = 10
+
+# Threads delivering analytics in the background during this execution
+_background_threads = []
+
+# Functions to call on the main thread once the background threads are done. [(function, args)]
+_join_callbacks = []
+
+
 def track(botengine, location_object, event_name, properties={}):
     """
     Track an event.
@@ -58,3 +70,61 @@ def people_unset(botengine, location_object, properties_list):
 
     location_object.distribute_datastream_message(botengine, "analytics_people_unset", content={"properties_list": properties_list}, internal=True, external=False)
 
+
+def flush(botengine, location_object):
+    """
+    Flush the analytics that were buffered during this execution.
+    The bot calls this at the end of each execution, right before variables get saved.
+
+    Only location microservices receive this 'analytics_flush' message, so devices that are loaded lazily stay in storage.
+
+    :param botengine: BotEngine environment
+    """
+    if botengine.is_test_location():
+        return
+
+    location_object.location_datastream_updated(botengine, "analytics_flush", None)
+
+
+def run_in_background(function, *args):
+    """
+    Deliver analytics on a background thread, so the execution can carry on and save its variables in the meantime.
+    The bot waits for the thread in join() before the execution ends.
+    :param function: Function to run
+    :param args: Arguments to the function
+    """
+    thread = threading.Thread(target=function, args=args)
+    thread.daemon = True
+    thread.start()
+    _background_threads.append(thread)
+
+
+def run_after_join(function, *args):
+    """
+    Call a function on the main thread once join() is done waiting for the background threads, for example to save
+    whatever a background thread couldn't deliver. Background threads must not touch botengine, but this can.
+    :param function: Function to call
+    :param args: Arguments to the function
+    """
+    _join_callbacks.append((function, args))
+
+
+def join(botengine):
+    """
+    Wait for analytics delivered in the background to finish. The bot calls this at the very end of each execution.
+    :param botengine: BotEngine environment
+    """
+    while len(_background_threads) > 0:
+        thread = _background_threads.pop()
+        thread.join(BACKGROUND_JOIN_TIMEOUT_S)
+        if thread.is_alive():
+            botengine.get_logger().warning("analytics.py: Analytics are still being delivered after {} seconds".format(BACKGROUND_JOIN_TIMEOUT_S))
+
+    while len(_join_callbacks) > 0:
+        function, args = _join_callbacks.pop(0)
+        try:
+            function(*args)
+
+        except Exception as e:
+            import traceback
+            botengine.get_logger().error("analytics.py: " + str(e) + "; " + traceback.format_exc())
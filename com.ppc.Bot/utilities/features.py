@@ -0,0 +1,274 @@
+'''
+Created on October 17, 2026
+
+This file is subject to the terms and conditions defined in the
+file 'LICENSE.txt', which is part of this source code package.
+
+@author: David Moss
+'''
+
+import csv
+import weakref
+
+import utilities.utilities as utilities
+import utilities.timestamps as timestamps
+
+# NumPy is imported by the functions that need it, because it's only installed by the bots that use these features.
+
+# CSV columns that describe the device or repeat the timestamp, instead of holding a measurement parameter
+METADATA_COLUMNS = ['device_type', 'device_id', 'description', 'timestamp_ms', 'timestamp_iso']
+
+# Timezone offsets only change on a quarter-hour boundary, so one offset lookup covers every timestamp in the same quarter hour
+OFFSET_RESOLUTION_MS = utilities.ONE_MINUTE_MS * 15
+
+# Features parsed from the data request in progress. (weak reference to the csv_dict, FeatureStore)
+# This clears itself as soon as the bot lets go of the csv_dict, so closed files and old devices aren't kept around.
+_features = (None, None)
+
+
+def get_features(botengine, csv_dict):
+    """
+    Get the features parsed from a data_request_ready() csv_dict.
+
+    The CSV data is parsed once per data request. Every microservice that receives the same csv_dict gets the same
+    FeatureStore back, along with any features another microservice already derived from it. A plain dict can't be
+    weakly referenced, so it gets parsed again on each call.
+
+    :param botengine: BotEngine environment
+    :param csv_dict: { device_object: bytes or SpooledCsv } from data_request_ready(), ideally a datarequest.CsvDict
+    :return: FeatureStore
+    """
+    global _features
+    if _features[0] is not None and _features[0]() is csv_dict:
+        return _features[1]
+
+    try:
+        reference = weakref.ref(csv_dict, _release)
+
+    except TypeError:
+        return FeatureStore(botengine, csv_dict)
+
+    _features = (reference, FeatureStore(botengine, csv_dict))
+    return _features[1]
+
+
+def _release(reference):
+    """
+    Forget the features of a csv_dict once it's gone
+    :param reference: Dead weak reference to the csv_dict
+    """
+    global _features
+    if _features[0] is reference:
+        _features = (None, None)
+
+
+class FeatureStore:
+    """
+    Time series parsed from the CSV data of a data request, one DeviceSeries per device.
+    """
+
+    def __init__(self, botengine, csv_dict):
+        """
+        Constructor
+        :param botengine: BotEngine environment
+        :param csv_dict: { device_object: bytes or SpooledCsv } from data_request_ready()
+        """
+        # Time series for each device. { 'device_id': DeviceSeries }
+        self.devices = {}
+
+        # Time series for each type of device. { device_type: [DeviceSeries] }
+        self.device_types = {}
+
+        for device_object in csv_dict:
+            if device_object is None:
+                continue
+
+            try:
+                series = DeviceSeries(device_object, csv_dict[device_object])
+
+            except Exception as e:
+                botengine.get_logger().warning("features.py: Unable to parse CSV data for '{}': {}".format(device_object.description, str(e)))
+                import traceback
+                botengine.get_logger().error(traceback.format_exc())
+                continue
+
+            self.devices[device_object.device_id] = series
+            self.device_types.setdefault(device_object.device_type, []).append(series)
+
+    def get_series(self, device_types=None):
+        """
+        Get the time series of all devices, or of specific types of devices
+        :param device_types: List of device types, or None for all devices
+        :return: List of DeviceSeries
+        """
+        if device_types is None:
+            return list(self.devices.values())
+
+        series = []
+        for device_type in device_types:
+            series += self.device_types.get(device_type, [])
+        return series
+
+
+class DeviceSeries:
+    """
+    Time series of one device from a data request, oldest first.
+
+    timestamps_ms is a NumPy int64 array. Each parameter in columns is a float64 array when all its values are
+    numbers, with NaN where the parameter wasn't measured, or an object array of normalized values otherwise.
+    """
+
+    def __init__(self, device_object, csv_data):
+        """
+        Constructor
+        :param device_object: Device object
+        :param csv_data: bytes, SpooledCsv, or string of CSV data for this device
+        """
+        import numpy as np
+
+        # Device object
+        self.device_object = device_object
+
+        # Timestamps in milliseconds
+        self.timestamps_ms = np.array([], dtype=np.int64)
+
+        # Values of each parameter, one for each timestamp. { 'param_name': array }
+        self.columns = {}
+
+        # Features derived from the timestamps, keyed by name and timezone. { ('name', 'timezone'): array }
+        self._derived = {}
+
+        reader = csv.reader(_lines(csv_data))
+        header = next(reader, None)
+        if header is None:
+            return
+
+        header = [title.strip() for title in header]
+        if 'timestamp_ms' not in header:
+            raise ValueError("CSV data has no 'timestamp_ms' column")
+
+        rows = [row for row in reader if len(row) > 0]
+        timestamp_index = header.index('timestamp_ms')
+        self.timestamps_ms = np.array([int(row[timestamp_index]) for row in rows], dtype=np.int64)
+
+        order = None
+        if len(self.timestamps_ms) > 1 and np.any(np.diff(self.timestamps_ms) < 0):
+            order = np.argsort(self.timestamps_ms, kind='mergesort')
+            self.timestamps_ms = self.timestamps_ms[order]
+
+        for index, title in enumerate(header):
+            if title == "" or title in METADATA_COLUMNS:
+                continue
+
+            column = _column([row[index] if index < len(row) else "" for row in rows])
+            if order is not None:
+                column = column[order]
+            self.columns[title] = column
+
+    def __len__(self):
+        return len(self.timestamps_ms)
+
+    def get_local_milliseconds(self, botengine):
+        """
+        Timestamps shifted into the location's local timezone, so whole days and hours line up with local midnight
+        :param botengine: BotEngine environment
+        :return: NumPy int64 array of local milliseconds since the epoch
+        """
+        tz = self.device_object.location_object.get_local_timezone(botengine)
+        key = ('local_ms', str(tz))
+        if key not in self._derived:
+            self._derived[key] = get_local_milliseconds(self.timestamps_ms, tz)
+
+        return self._derived[key]
+
+    def get_hour_of_day(self, botengine):
+        """
+        Local hour of the day (float) of each timestamp, like Location.get_local_hour_of_day()
+        :param botengine: BotEngine environment
+        :return: NumPy float64 array, 0.0 - 23.99
+        """
+        tz = self.device_object.location_object.get_local_timezone(botengine)
+        key = ('hour_of_day', str(tz))
+        if key not in self._derived:
+            self._derived[key] = get_hours_of_day(self.get_local_milliseconds(botengine))
+
+        return self._derived[key]
+
+    def get_day_of_week(self, botengine):
+        """
+        Local day of the week of each timestamp, like Location.get_local_day_of_week()
+        :param botengine: BotEngine environment
+        :return: NumPy int64 array, 0 = Monday through 6 = Sunday
+        """
+        tz = self.device_object.location_object.get_local_timezone(botengine)
+        key = ('day_of_week', str(tz))
+        if key not in self._derived:
+            self._derived[key] = get_days_of_week(self.get_local_milliseconds(botengine))
+
+        return self._derived[key]
+
+
+def get_local_milliseconds(timestamps_ms, tz):
+    """
+    Shift timestamps into a local timezone, so whole days and hours line up with local midnight
+    :param timestamps_ms: Array of timestamps in milliseconds
+    :param tz: tzinfo
+    :return: NumPy int64 array of local milliseconds since the epoch
+    """
+    import numpy as np
+    timestamps_ms = np.asarray(timestamps_ms, dtype=np.int64)
+    buckets, inverse = np.unique(timestamps_ms // OFFSET_RESOLUTION_MS, return_inverse=True)
+    offsets = np.array([timestamps.utc_offset_ms(int(bucket) * OFFSET_RESOLUTION_MS, tz) for bucket in buckets], dtype=np.int64)
+    return timestamps_ms + offsets[inverse].reshape(timestamps_ms.shape)
+
+
+def get_hours_of_day(local_ms):
+    """
+    :param local_ms: Array of local milliseconds from get_local_milliseconds()
+    :return: NumPy float64 array of relative hours of the day, 0.0 - 23.99
+    """
+    import numpy as np
+    return (np.asarray(local_ms) % utilities.ONE_DAY_MS) / float(utilities.ONE_HOUR_MS)
+
+
+def get_days_of_week(local_ms):
+    """
+    :param local_ms: Array of local milliseconds from get_local_milliseconds()
+    :return: NumPy int64 array of days of the week, 0 = Monday through 6 = Sunday
+    """
+    import numpy as np
+
+    # January 1, 1970 was a Thursday
+    return (np.asarray(local_ms) // utilities.ONE_DAY_MS + 3) % 7
+
+
+def _lines(csv_data):
+    """
+    Lines of text from CSV data
+    :param csv_data: SpooledCsv, bytes, or string
+    :return: Iterable of strings
+    """
+    if isinstance(csv_data, utilities._string_types) or isinstance(csv_data, bytes):
+        csv_data = [csv_data]
+
+    for data in csv_data:
+        if not isinstance(data, str):
+            data = data.decode('utf-8')
+
+        for line in data.splitlines():
+            yield line
+
+
+def _column(values):
+    """
+    Convert one column of CSV values into a typed array
+    :param values: List of strings
+    :return: NumPy float64 array if every value is a number or empty, otherwise an object array of normalized values
+    """
+    import numpy as np
+    try:
+        return np.array([value if value != "" else "nan" for value in values], dtype=np.float64)
+
+    except ValueError:
+        return np.array([utilities.normalize_measurement(value) if value != "" else None for value in values], dtype=object)
+
@@ -0,0 +1,82 @@
+'''
+Created on October 17, 2026
+
+This file is subject to the terms and conditions defined in the
+file 'LICENSE.txt', which is part of this source code package.
+
+@author: David Moss
+'''
+
+import pickle
+
+# Version of the model store format
+MODEL_STORE_VERSION = 1
+
+
+def save_models(botengine, name, models):
+    """
+    Save a list of machine learning models, each in its own variable, so they can be loaded one at a time.
+
+    Each model is pickled with the highest protocol available, which writes NumPy arrays as raw binary buffers.
+    The variable 'name' holds a small manifest, and the models are stored as 'name.0', 'name.1', etc.
+
+    :param botengine: BotEngine environment
+    :param name: Variable name of this list of models
+    :param models: List of models
+    :return: Total size of the saved models in bytes
+    """
+    manifest = botengine.load_variable(name)
+    previous_count = 0
+    if isinstance(manifest, dict):
+        previous_count = manifest.get('count', 0)
+
+    size = 0
+    for index, model in enumerate(models):
+        data = pickle.dumps(model, pickle.HIGHEST_PROTOCOL)
+        botengine.save_variable("{}.{}".format(name, index), data)
+        size += len(data)
+
+    for index in range(len(models), previous_count):
+        botengine.delete_variable("{}.{}".format(name, index))
+
+    botengine.save_variable(name, {'version': MODEL_STORE_VERSION, 'count': len(models), 'size': size})
+    return size
+
+
+def load_model(botengine, name, index):
+    """
+    Load one model from a list of models saved with save_models()
+    :param botengine: BotEngine environment
+    :param name: Variable name of this list of models
+    :param index: Index of the model to load
+    :return: Model, or None if it doesn't exist
+    """
+    manifest = botengine.load_variable(name)
+    if isinstance(manifest, list):
+        # Saved as one list of models before this store existed
+        if 0 <= index < len(manifest):
+            return manifest[index]
+        return None
+
+    if not isinstance(manifest, dict) or not 0 <= index < manifest.get('count', 0):
+        return None
+
+    data = botengine.load_variable("{}.{}".format(name, index))
+    if data is None:
+        return None
+
+    return pickle.loads(data)
+
+
+def delete_models(botengine, name):
+    """
+    Delete a list of models saved with save_models()
+    :param botengine: BotEngine environment
+    :param name: Variable name of this list of models
+    """
+    manifest = botengine.load_variable(name)
+    if isinstance(manifest, dict):
+        for index in range(manifest.get('count', 0)):
+            botengine.delete_variable("{}.{}".format(name, index))
+
+    botengine.delete_variable(name)
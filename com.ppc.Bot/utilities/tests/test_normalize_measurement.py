@@ -0,0 +1,62 @@
+import utilities.utilities as utilities
+
+
+def eval_normalize_measurement(measure):
+    """
+    Previous eval() implementation of utilities.normalize_measurement(), for comparison
+    """
+    try:
+        return eval(measure, {}, {})
+
+    except:
+        if measure in ['true', 'True']:
+            return True
+
+        elif measure in ['false', 'False']:
+            return False
+
+        else:
+            return measure
+
+
+# Raw measurement values the way the server delivers them
+MEASUREMENTS = ["0", "1", "-1", "+7", "00", "01234", "23.5", "-0.25", ".5", "5.", "1e3", "2.5E-2", "0x1F",
+                "True", "False", "true", "false", "None", "null", "ON", "closed", "", " 12 ",
+                "[1, 2, 3]", "{'a': 1}", "'quoted'", "\"double quoted\"", "(1, 2)", "[true]", "{broken",
+                "abc123", "12abc", "1.2.3", "-", "."]
+
+
+class TestNormalizeMeasurement:
+
+    def test_same_as_eval(self):
+        """
+        The parser returns the same value and type as eval() for measurement values
+        """
+        for measure in MEASUREMENTS:
+            expected = eval_normalize_measurement(measure)
+            assert utilities.normalize_measurement(measure) == expected, measure
+            assert type(utilities.normalize_measurement(measure)) == type(expected), measure
+
+    def test_no_code_execution(self):
+        """
+        Expressions and names of Python built-ins are not evaluated
+        """
+        assert utilities.normalize_measurement("open") == "open"
+        assert utilities.normalize_measurement("__import__('os')") == "__import__('os')"
+        assert utilities.normalize_measurement("len('abc')") == "len('abc')"
+
+    def test_non_strings(self):
+        """
+        Values that are already normalized are returned as they are
+        """
+        assert utilities.normalize_measurement(5) == 5
+        assert utilities.normalize_measurement(True) is True
+        assert utilities.normalize_measurement(None) is None
+
+    def test_mutable_values_are_not_shared(self):
+        """
+        Each caller gets its own list or dictionary
+        """
+        first = utilities.normalize_measurement("[1, 2]")
+        first.append(3)
+        assert utilities.normalize_measurement("[1, 2]") == [1, 2]
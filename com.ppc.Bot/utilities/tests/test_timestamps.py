@@ -0,0 +1,54 @@
+import calendar
+import datetime
+
+import pytz
+
+import utilities.timestamps as timestamps
+
+
+# Timestamps around daylight saving time transitions, leap days, and the epoch
+TIMESTAMPS_MS = [0, 1, 999, 1000, -1, -1001, 951782400000, 1552204800000, 1552211999999, 1552212000000,
+                 1572771600000, 1572775200000, 1582934400123, 1600000000000, 1700000000456, 4102444800000]
+
+TIMEZONES = ["UTC", "US/Pacific", "US/Eastern", "Europe/London", "Asia/Kathmandu", "Australia/Lord_Howe"]
+
+
+class TestTimestamps:
+
+    def test_round_trip(self):
+        """
+        Timestamps survive conversion into a local datetime and back, exactly to the millisecond
+        """
+        for name in TIMEZONES:
+            tz = pytz.timezone(name)
+            for timestamp_ms in TIMESTAMPS_MS:
+                dt = timestamps.timestamp_ms_to_datetime(timestamp_ms, tz)
+                assert timestamps.datetime_to_timestamp_ms(dt) == timestamp_ms, (name, timestamp_ms)
+                assert dt.microsecond == (timestamp_ms % 1000) * 1000, (name, timestamp_ms)
+
+    def test_same_as_calendar(self):
+        """
+        Whole-second conversions match the standard library
+        """
+        for name in TIMEZONES:
+            tz = pytz.timezone(name)
+            for timestamp_ms in TIMESTAMPS_MS:
+                dt = timestamps.timestamp_ms_to_datetime(timestamp_ms, tz)
+                assert dt == datetime.datetime.fromtimestamp(timestamp_ms / 1000.0, tz), (name, timestamp_ms)
+                assert timestamps.datetime_to_timestamp_ms(dt.replace(microsecond=0)) == calendar.timegm(dt.utctimetuple()) * 1000, (name, timestamp_ms)
+
+    def test_naive_is_utc(self):
+        """
+        Naive datetimes are treated as UTC
+        """
+        assert timestamps.datetime_to_timestamp_ms(datetime.datetime(1970, 1, 2)) == 86400000
+        assert timestamps.timestamp_ms_to_datetime(86400001) == datetime.datetime(1970, 1, 2, 0, 0, 0, 1000)
+
+    def test_utc_offset(self):
+        """
+        UTC offsets follow daylight saving time
+        """
+        tz = pytz.timezone("US/Pacific")
+        assert timestamps.utc_offset_ms(1552211999999, tz) == -8 * 3600000
+        assert timestamps.utc_offset_ms(1552212000000, tz) == -7 * 3600000
+        assert timestamps.utc_offset_ms(0, pytz.timezone("Asia/Kathmandu")) == 19800000
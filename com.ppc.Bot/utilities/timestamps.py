@@ -0,0 +1,56 @@
+'''
+Created on October 17, 2026
+
+This file is subject to the terms and conditions defined in the
+file 'LICENSE.txt', which is part of this source code package.
+
+@author: David Moss
+'''
+
+import datetime
+
+# Unix epoch, as a naive UTC datetime
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def datetime_to_timestamp_ms(dt):
+    """
+    Convert a datetime to a Unix timestamp in milliseconds, using integer arithmetic so it's exact to the millisecond.
+
+    A timezone-aware datetime is converted using its own UTC offset, so this doesn't depend on the timezone of the
+    machine running the bot. A naive datetime is assumed to already be in UTC.
+
+    :param dt: Datetime
+    :return: Timestamp in milliseconds
+    """
+    offset = dt.utcoffset()
+    if offset is not None:
+        dt = dt.replace(tzinfo=None) - offset
+
+    delta = dt - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000 + delta.microseconds // 1000
+
+
+def timestamp_ms_to_datetime(timestamp_ms, tz=None):
+    """
+    Convert a Unix timestamp in milliseconds to a datetime, exact to the millisecond
+    :param timestamp_ms: Timestamp in milliseconds
+    :param tz: tzinfo to convert into, or None for a naive UTC datetime
+    :return: Datetime
+    """
+    dt = EPOCH + datetime.timedelta(milliseconds=timestamp_ms)
+    if tz is None:
+        return dt
+
+    return tz.fromutc(dt.replace(tzinfo=tz))
+
+
+def utc_offset_ms(timestamp_ms, tz):
+    """
+    Get the offset of a timezone from UTC at a moment in time
+    :param timestamp_ms: Timestamp in milliseconds
+    :param tz: tzinfo
+    :return: Offset in milliseconds, for example -28800000 for Pacific Standard Time
+    """
+    offset = timestamp_ms_to_datetime(timestamp_ms, tz).utcoffset()
+    return (offset.days * 86400 + offset.seconds) * 1000 + offset.microseconds // 1000
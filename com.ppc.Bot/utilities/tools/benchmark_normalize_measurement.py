@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# encoding: utf-8
+'''
+Created on October 17, 2026
+
+Compare utilities.normalize_measurement() against the previous eval() implementation on the same measurement values.
+
+    python benchmark_normalize_measurement.py -r 5
+
+@author: David Moss
+'''
+
+import os
+import sys
+import timeit
+
+from argparse import ArgumentParser
+from argparse import RawDescriptionHelpFormatter
+
+
+def main(argv=None):
+
+    if argv is None:
+        argv = sys.argv
+    else:
+        sys.argv.extend(argv)
+
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    parser = ArgumentParser(formatter_class=RawDescriptionHelpFormatter)
+
+    parser.add_argument("-r", "--repeat", dest="repeat", type=int, default=5, help="Number of times to repeat each measurement")
+    parser.add_argument("-n", "--copies", dest="copies", type=int, default=100, help="Number of copies of the measurement values to normalize each time")
+
+    # Process arguments
+    args, unknown = parser.parse_known_args()
+
+    sys.path.insert(0, os.path.join(here, "..", ".."))
+    sys.path.insert(0, os.path.join(here, "..", "tests"))
+
+    import utilities.utilities as utilities
+    from test_normalize_measurement import MEASUREMENTS, eval_normalize_measurement
+
+    values = MEASUREMENTS * args.copies
+    eval_s = timeit.timeit(lambda: [eval_normalize_measurement(v) for v in values], number=args.repeat)
+    parser_s = timeit.timeit(lambda: [utilities.normalize_measurement(v) for v in values], number=args.repeat)
+    print("normalize_measurement() on {} values: eval={:.4f}s; parser={:.4f}s; {:.1f}x faster".format(len(values) * args.repeat, eval_s, parser_s, eval_s / parser_s))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
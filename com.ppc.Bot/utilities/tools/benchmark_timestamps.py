@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# encoding: utf-8
+'''
+Created on October 17, 2026
+
+Compare timestamps.datetime_to_timestamp_ms() against the previous strftime('%s') implementation
+of Location.timezone_aware_datetime_to_unix_timestamp().
+
+    python benchmark_timestamps.py -t US/Pacific -r 5
+
+@author: David Moss
+'''
+
+import os
+import sys
+import timeit
+
+from argparse import ArgumentParser
+from argparse import RawDescriptionHelpFormatter
+
+
+def strftime_timestamp_ms(dt):
+    """
+    Previous strftime('%s') implementation of Location.timezone_aware_datetime_to_unix_timestamp(), for comparison.
+    This is only correct when the datetime is first converted into the timezone of the machine running it.
+    """
+    return int(dt.astimezone().strftime("%s")) * 1000
+
+
+def main(argv=None):
+
+    if argv is None:
+        argv = sys.argv
+    else:
+        sys.argv.extend(argv)
+
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    parser = ArgumentParser(formatter_class=RawDescriptionHelpFormatter)
+
+    parser.add_argument("-t", "--timezone", dest="timezone", default="US/Pacific", help="Timezone of the datetimes to convert")
+    parser.add_argument("-r", "--repeat", dest="repeat", type=int, default=5, help="Number of times to repeat each measurement")
+    parser.add_argument("-n", "--copies", dest="copies", type=int, default=100, help="Number of copies of the test timestamps to convert each time")
+
+    # Process arguments
+    args, unknown = parser.parse_known_args()
+
+    sys.path.insert(0, os.path.join(here, "..", ".."))
+    sys.path.insert(0, os.path.join(here, "..", "tests"))
+
+    import pytz
+    import utilities.timestamps as timestamps
+    from test_timestamps import TIMESTAMPS_MS
+
+    tz = pytz.timezone(args.timezone)
+    datetimes = [timestamps.timestamp_ms_to_datetime(timestamp_ms, tz) for timestamp_ms in TIMESTAMPS_MS if timestamp_ms >= 0] * args.copies
+    strftime_s = timeit.timeit(lambda: [strftime_timestamp_ms(dt) for dt in datetimes], number=args.repeat)
+    epoch_s = timeit.timeit(lambda: [timestamps.datetime_to_timestamp_ms(dt) for dt in datetimes], number=args.repeat)
+    print("datetime_to_timestamp_ms() on {} datetimes: strftime={:.4f}s; epoch={:.4f}s; {:.1f}x faster".format(len(datetimes) * args.repeat, strftime_s, epoch_s, strftime_s / epoch_s))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
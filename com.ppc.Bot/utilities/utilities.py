@@ -7,6 +7,17 @@ file 'LICENSE.txt', which is part of this source code package.
 @author: David Moss
 '''
 
+import ast
+import datetime
+import re
+
+try:
+    # Python 2
+    _string_types = basestring
+except NameError:
+    # Python 3
+    _string_types = str
+
 # Time conversions to ms
 ONE_SECOND_MS = 1000
 ONE_MINUTE_MS = 60 * ONE_SECOND_MS
@@ -233,24 +244,77 @@ def ms_to_human_readable_string(ms, include_seconds=False):
 
     return str.strip()
 
+# Measurement values that are words instead of Python literals
+MEASUREMENT_WORDS = {
+    'True': True,
+    'true': True,
+    'False': False,
+    'false': False,
+    'None': None
+}
+
+# Integers and floats as Python would read them. Integers with leading zeros, like zip codes, are not numbers.
+MEASUREMENT_INT_PATTERN = re.compile(r'[-+]?([1-9][0-9]*|0+)\Z')
+MEASUREMENT_FLOAT_PATTERN = re.compile(r'[-+]?(([0-9]+\.[0-9]*|\.[0-9]+)([eE][-+]?[0-9]+)?|[0-9]+[eE][-+]?[0-9]+)\Z')
+
+# Measurement values that could be a literal we don't have a fast path for, like a list, dictionary, quoted string, or hex number
+MEASUREMENT_LITERAL_CHARACTERS = '0123456789+-.[{(\'"'
+
+# Maximum number of normalized measurement values to remember
+MEASUREMENT_CACHE_SIZE = 10000
+
+# Normalized measurement values. Only immutable values are cached. { 'raw_value': normalized_value }
+_normalized_measurements = {}
+
 def normalize_measurement(measure):
     """
     Transform a measurement's value, which could be a string, into a real value - like a boolean or int or float
     :param measure: a raw measurement's value
     :return: a value that has been corrected into the right type
     """
+    if not isinstance(measure, _string_types):
+        return measure
+
     try:
-        return eval(measure, {}, {})
+        return _normalized_measurements[measure]
+    except KeyError:
+        pass
+
+    value = _parse_measurement(measure)
+    if isinstance(value, (list, dict, set)):
+        # Every caller gets its own copy of mutable values
+        return value
+
+    if len(_normalized_measurements) >= MEASUREMENT_CACHE_SIZE:
+        _normalized_measurements.clear()
+
+    _normalized_measurements[measure] = value
+    return value
+
+def _parse_measurement(measure):
+    """
+    Parse a measurement's string value without eval()
+    :param measure: a raw measurement's string value
+    :return: the value as a bool, int, float, None, or literal; or the original string if it isn't any of those
+    """
+    text = measure.strip()
+
+    if text in MEASUREMENT_WORDS:
+        return MEASUREMENT_WORDS[text]
+
+    if MEASUREMENT_INT_PATTERN.match(text):
+        return int(text)
 
-    except:
-        if measure in ['true', 'True']:
-            return True
+    if MEASUREMENT_FLOAT_PATTERN.match(text):
+        return float(text)
 
-        elif measure in ['false', 'False']:
-            return False
+    if len(text) > 0 and text[0] in MEASUREMENT_LITERAL_CHARACTERS:
+        try:
+            return ast.literal_eval(text)
+        except:
+            pass
 
-        else:
-            return measure
+    return measure
 
 def get_answer(question_object):
     """
@@ -276,6 +340,51 @@ def iso_format(dt):
     """
     return dt.strftime("%Y-%m-%dT%H:%M:%S." + '%03d' % (dt.microsecond / 1000) + "%z")
 
+class IsoFormatter:
+    """
+    Format many timestamps in one timezone the same way as iso_format(), for writing large .csv files.
+    The timezone is resolved once, and timestamps within the same second share one conversion to a local datetime.
+    """
+
+    def __init__(self, tzinfo):
+        """
+        :param tzinfo: Timezone to format timestamps in
+        """
+        self.tzinfo = tzinfo
+        self.second = None
+        self.prefix = None
+        self.suffix = None
+
+    def format(self, timestamp_ms):
+        """
+        :param timestamp_ms: Timestamp in milliseconds
+        :return: ISO formatted string in milliseconds, like "2020-01-31T14:15:16.123-0800"
+        """
+        timestamp_ms = int(timestamp_ms)
+        second = timestamp_ms // 1000
+        if second != self.second:
+            dt = datetime.datetime.fromtimestamp(second, self.tzinfo)
+            self.prefix = dt.strftime("%Y-%m-%dT%H:%M:%S.")
+            self.suffix = dt.strftime("%z")
+            self.second = second
+
+        return "{}{:03d}{}".format(self.prefix, timestamp_ms % 1000, self.suffix)
+
+def write_lines(lines, output_file=None):
+    """
+    Write lines of text, like .csv rows, to a file-like object as they are generated, or join them into a string
+    :param lines: Iterable of strings, each ending with a newline
+    :param output_file: File-like object to write to, or None to return a string
+    :return: The output_file if one was given, otherwise the joined string
+    """
+    if output_file is None:
+        return "".join(lines)
+
+    for line in lines:
+        output_file.write(line)
+
+    return output_file
+
 def getsize(obj_0):
     """
     Recursively iterate to sum size of object & members.
@@ -11,6 +11,8 @@ from intelligence.intelligence import Intelligence
 from devices.motion.motion import MotionDevice
 from devices.entry.entry import EntryDevice
 import utilities
+import utilities.features as features
+import utilities.models as models
 
 # You would have your own machine learning implementation here.
 import intelligence.ml_example.ml_engine_example as ml
@@ -95,8 +97,10 @@ class LocationMlExampleMicroservice(Intelligence):
     all data from the location as requested by the 'data_request' microservice package.
 
     Some machine learning developers choose to preprocess the raw CSV data before building models. For example,
-    you may take the data you're interested in, and merge it together into a single chronological narrative. While
-    we're not showing this preprocess step here, you could assume it would take place in the ml_engine_example.py.
+    you may take the data you're interested in, and merge it together into a single chronological narrative. The
+    raw CSV data is parsed once per execution by utilities.features into NumPy time series for each device, which
+    every microservice reacting to the same data request shares. Further preprocessing would take place in
+    ml_engine_example.py.
 
     Note the structure.json file in this microservice package includes scipy, numpy, and sklearn packages, which
     would normally be an important set of tools for most machine learning services.
@@ -141,7 +145,7 @@ class LocationMlExampleMicroservice(Intelligence):
         """
         # This microservice is getting destroyed, so remove its non-volatile memory so we don't end up
         # with zombie wasted space.
-        botengine.delete_variable(VARIABLE_ABSENT_MODELS)
+        models.delete_models(botengine, VARIABLE_ABSENT_MODELS)
 
     def mode_updated(self, botengine, current_mode):
         """
@@ -212,16 +216,6 @@ class LocationMlExampleMicroservice(Intelligence):
         """
         return
 
-    def datastream_updated(self, botengine, address, content):
-        """
-        Data Stream Message Received
-        :param botengine: BotEngine environment
-        :param address: Data Stream address
-        :param content: Content of the message
-        """
-        if hasattr(self, address):
-            getattr(self, address)(botengine, content)
-
     def schedule_fired(self, botengine, schedule_id):
         """
         The bot executed on a hard coded schedule specified by our runtime.json file
@@ -267,14 +261,11 @@ class LocationMlExampleMicroservice(Intelligence):
             # Extract a day-of-the-week feature for our ML prediction
             day_of_week = self.parent.get_local_day_of_week(botengine)
 
-            # Download our absent models from non-volatile memory
-            absent_models = botengine.load_variable(VARIABLE_ABSENT_MODELS)
-
             # The argument[1] contains the last door closed object
             last_door_closed_object = argument[1]
 
-            # Grab a specific model for the amount of time that has elapsed
-            focused_model = absent_models[self.focused_duration_index]
+            # Download only the specific model for the amount of time that has elapsed from non-volatile memory
+            focused_model = models.load_model(botengine, VARIABLE_ABSENT_MODELS, self.focused_duration_index)
 
             # Initial probability that this user is absent - set low but greater than 0.0.
             probability_absent = H2A_CONFIDENCE_THRESHOLD
@@ -406,7 +397,7 @@ class LocationMlExampleMicroservice(Intelligence):
 
         :param botengine: BotEngine environment
         :param reference: Optional reference passed into botengine.request_data(..)
-        :param csv_dict: { device_object: 'csv data string' }
+        :param csv_dict: { device_object: bytes or SpooledCsv }
         """
         if reference == "all":
             # This is a data request response that was driven by the 'data_request' microservice package.
@@ -424,16 +415,16 @@ class LocationMlExampleMicroservice(Intelligence):
                 # There is effectively one model calculated per duration of time.
                 # Underneath, you would implement algorithms to take this raw data and convert it into
                 # models, using whatever machine learning tools you believe are appropriate for this task.
-                absent_models = ml.generate_prediction_models(csv_dict, self.durations)
+                # The CSV data is parsed once and shared with any other microservice using the same data request.
+                absent_models = ml.generate_prediction_models(features.get_features(botengine, csv_dict), self.durations)
 
                 # Now save the model. The model can potentially get quite large, and we do not need it for every
                 # execution of the bot. Therefore it's a perfect candidate to store in its own variable direct
                 # through the botengine environment, instead of as a class variable locally here which would
                 # have to get downloaded with every trigger and execution of the bot.
-                botengine.save_variable(VARIABLE_ABSENT_MODELS, absent_models)
-
-                # Let's see how big the model got.
-                size = utilities.getsize(absent_models)
+                # Each duration's model is saved separately, so each timer only downloads the one model it needs.
+                # Let's also see how big the model got.
+                size = models.save_models(botengine, VARIABLE_ABSENT_MODELS, absent_models)
                 botengine.get_logger().info("sizeof(home_away_model) = {}".format(size))
 
                 # Let's track the results to our analytics tools of choice.
@@ -28,7 +28,22 @@ def get_prediction_value(relative_hour_of_day, day_of_week, last_door_closed_obj
     import random
     return random.random()
 
-def generate_prediction_models(csv_dict, durations_min):
+def get_prediction_values(relative_hours_of_day, days_of_week, last_door_closed_ids, models):
+    """
+    Vectorized version of get_prediction_value() for backtesting and offline evaluation.
+    Instead of evaluating one set of features against one model at a time, this evaluates every set of features
+    against every duration's model in one pass over NumPy arrays.
+    :param relative_hours_of_day: NumPy array of relative hours of the day (0.0 - 23.99), one per evaluation
+    :param days_of_week: NumPy array of days of the week (0-6), one per evaluation
+    :param last_door_closed_ids: NumPy array of the device ID of the last door that closed, one per evaluation
+    :param models: List of machine learning models, one per duration, previously calculated by generate_prediction_models()
+    :return: NumPy array of shape (len(models), number of evaluations) of predictions between 0.0 - 1.0 that the house is unoccupied.
+    """
+    # Same exercise for the reader as get_prediction_value(), only a whole array of random numbers at once.
+    import numpy as np
+    return np.random.random((len(models), len(relative_hours_of_day)))
+
+def generate_prediction_models(feature_store, durations_min):
     """
     For each duration in minutes since a door was last closed, generate a machine learning model
     that describes - based on all the data and history from this location - what the probability is that
@@ -38,7 +53,7 @@ def generate_prediction_models(csv_dict, durations_min):
 
     Return an list of machine learning models, one for each duration in time to evaluate after a door closed.
 
-    :param csv_dict: History of all data from this location in CSV form, downloaded safely from the server through the 'data_request' package.
+    :param feature_store: utilities.features.FeatureStore of all data from this location, downloaded safely from the server through the 'data_request' package. For example, feature_store.get_series([device_type]) returns each device's NumPy time series, with memoized get_hour_of_day() and get_day_of_week() features.
     :param durations_min: List of durations in minutes we want to evaluate after a door closes. One model is generated per duration.
     :return: List of machine learning models to be saved externally and injected into get_prediction_value() when we want to evaluate current conditions.
     """
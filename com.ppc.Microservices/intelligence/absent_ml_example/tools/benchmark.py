@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# encoding: utf-8
+'''
+Created on October 17, 2026
+
+Replay recorded locations through the absent machine learning path, and compare evaluating one prediction at a time
+with get_prediction_value() against evaluating everything in one pass with get_prediction_values().
+
+Record a location by saving its data request CSV files into a directory, for example with EXPORT_CSV_TO_LOCAL_FILES
+in the 'data_request' microservice package. Each file is named {device_id}_{device_type}.csv.
+
+    python benchmark.py -d recordings/location_1 -d recordings/location_2 -t US/Pacific
+
+@author: David Moss
+'''
+
+import os
+import sys
+import glob
+import time
+import logging
+
+from argparse import ArgumentParser
+from argparse import RawDescriptionHelpFormatter
+
+# Door closed events are evaluated at each of these durations afterwards, like the microservice does
+EVALUATION_INTERVALS_IN_MINUTES = [15, 20, 25, 30, 35, 40, 45, 50, 55, 60]
+
+# Entry sensor device types and the parameter describing whether the door is open
+ENTRY_DEVICE_TYPES = [10014, 10074]
+ENTRY_STATUS_PARAMETER = "doorStatus"
+
+
+def main(argv=None):
+
+    if argv is None:
+        argv = sys.argv
+    else:
+        sys.argv.extend(argv)
+
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    parser = ArgumentParser(formatter_class=RawDescriptionHelpFormatter)
+
+    parser.add_argument("-d", "--directory", dest="directories", action="append", help="Directory of recorded CSV files for one location. Repeat for more locations.")
+    parser.add_argument("-t", "--timezone", dest="timezone", default="US/Pacific", help="Timezone of the recorded locations")
+    parser.add_argument("-r", "--repeat", dest="repeat", type=int, default=5, help="Number of times to repeat each measurement")
+    parser.add_argument("-b", "--bot", dest="bot", default=os.path.join(here, "..", "..", "..", "..", "com.ppc.Bot"), help="Path to the com.ppc.Bot directory")
+
+    # Process arguments
+    args, unknown = parser.parse_known_args()
+
+    if not args.directories:
+        parser.print_help()
+        return 1
+
+    sys.path.insert(0, os.path.join(here, ".."))
+    sys.path.insert(0, args.bot)
+
+    import numpy as np
+    import pytz
+    import utilities.features as features
+    import ml_engine_example as ml
+
+    location = RecordedLocation(pytz.timezone(args.timezone))
+    botengine = RecordedBotEngine()
+
+    for directory in args.directories:
+        csv_dict = {}
+        for filename in sorted(glob.glob(os.path.join(directory, "*.csv"))):
+            device_id, device_type = os.path.splitext(os.path.basename(filename))[0].rsplit("_", 1)
+            with open(filename, "rb") as f:
+                csv_dict[RecordedDevice(device_id, int(device_type), location)] = f.read()
+
+        start = time.time()
+        feature_store = features.get_features(botengine, csv_dict)
+        parse_s = time.time() - start
+
+        models = ml.generate_prediction_models(feature_store, EVALUATION_INTERVALS_IN_MINUTES)
+        if not models:
+            # The example engine doesn't generate real models, but the evaluation path still runs once per duration
+            models = [None] * len(EVALUATION_INTERVALS_IN_MINUTES)
+
+        # Features at every door closed event in the recording
+        hours = []
+        days = []
+        doors = []
+        for series in feature_store.get_series(ENTRY_DEVICE_TYPES):
+            if ENTRY_STATUS_PARAMETER not in series.columns:
+                continue
+
+            closed = series.columns[ENTRY_STATUS_PARAMETER] == False
+            hours.append(series.get_hour_of_day(botengine)[closed])
+            days.append(series.get_day_of_week(botengine)[closed])
+            doors.append(np.repeat(np.array([series.device_object.device_id], dtype=object), np.count_nonzero(closed)))
+
+        if len(hours) == 0:
+            print("{}: No door closed events to replay".format(directory))
+            continue
+
+        hours = np.concatenate(hours)
+        days = np.concatenate(days)
+        doors = np.concatenate(doors)
+        evaluations = len(hours) * len(models)
+
+        def scalar():
+            for i in range(len(hours)):
+                for model in models:
+                    ml.get_prediction_value(hours[i], days[i], doors[i], model)
+
+        def batch():
+            ml.get_prediction_values(hours, days, doors, models)
+
+        scalar_s = _best_of(scalar, args.repeat)
+        batch_s = _best_of(batch, args.repeat)
+
+        print(Color.BOLD + directory + Color.END)
+        print("\tParsed {} devices in {:.4f}s".format(len(feature_store.devices), parse_s))
+        print("\t{} door closed events x {} models = {} evaluations".format(len(hours), len(models), evaluations))
+        print("\tOne at a time: {:.4f}s ({:.2f}us per evaluation)".format(scalar_s, scalar_s * 1e6 / evaluations))
+        print("\tBatch: {:.4f}s ({:.2f}us per evaluation); {:.1f}x faster".format(batch_s, batch_s * 1e6 / evaluations, scalar_s / max(batch_s, 1e-9)))
+
+    return 0
+
+
+def _best_of(function, repeat):
+    """
+    :param function: Function to time
+    :param repeat: Number of times to run it
+    :return: Fastest run time in seconds
+    """
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        function()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+class RecordedBotEngine:
+    """
+    Just enough of the BotEngine environment to parse recorded features
+    """
+    def get_logger(self):
+        return logging.getLogger()
+
+
+class RecordedLocation:
+    """
+    Recorded location
+    """
+    def __init__(self, timezone):
+        self.timezone = timezone
+
+    def get_local_timezone(self, botengine):
+        return self.timezone
+
+
+class RecordedDevice:
+    """
+    Recorded device
+    """
+    def __init__(self, device_id, device_type, location_object):
+        self.device_id = device_id
+        self.device_type = device_type
+        self.description = device_id
+        self.location_object = location_object
+
+
+class Color:
+    """Color your command line output text with Color.WHATEVER and Color.END"""
+    PURPLE = '\033[95m'
+    CYAN = '\033[96m'
+    DARKCYAN = '\033[36m'
+    BLUE = '\033[94m'
+    GREEN = '\033[92m'
+    YELLOW = '\033[93m'
+    RED = '\033[91m'
+    BOLD = '\033[1m'
+    UNDERLINE = '\033[4m'
+    END = '\033[0m'
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,13 +8,26 @@ file 'LICENSE.txt', which is part of this source code package.
 '''
 
 from intelligence.intelligence import Intelligence
+import utilities.analytics as analytics
 
 # Variable name for tracking people
 AMPLITUDE_USER_PROPERTIES_VARIABLE_NAME = "amplitude_user"
 
+# Variable name for events that couldn't be sent, so we can try again in the next execution
+AMPLITUDE_SPILLED_EVENTS_VARIABLE_NAME = "amplitude_spilled"
+
+# Maximum number of spilled events to keep. The oldest events get dropped first.
+AMPLITUDE_MAXIMUM_SPILLED_EVENTS = 1000
+
 # HTTP timeout
 AMPLITUDE_HTTP_TIMEOUT_S = 2
 
+# Number of times to try sending each batch of events
+AMPLITUDE_HTTP_ATTEMPTS = 3
+
+# Amplitude HTTP API
+AMPLITUDE_URL = "https://api.amplitude.com/2/httpapi"
+
 class LocationAmplitudeMicroservice(Intelligence):
 
     def __init__(self, botengine, parent):
@@ -24,8 +37,22 @@ class LocationAmplitudeMicroservice(Intelligence):
         """
         Intelligence.__init__(self, botengine, parent)
 
+        # True if events that couldn't be sent are saved in the AMPLITUDE_SPILLED_EVENTS_VARIABLE_NAME variable
+        self.has_spilled_events = False
+
         self.analytics_track(botengine, {'event_name': 'reset', 'properties': None})
 
+    def __getstate__(self):
+        """
+        Don't save the events buffered during this execution. They get flushed before variables are saved.
+        :return: State of this object to save
+        """
+        state = self.__dict__.copy()
+        state.pop('_events', None)
+        state.pop('_user_properties', None)
+        state.pop('_user_properties_changed', None)
+        return state
+
     def analytics_track(self, botengine, content):
         """
         Track an event.
@@ -50,20 +77,18 @@ class LocationAmplitudeMicroservice(Intelligence):
         properties["locationId"] = botengine.get_location_id()
         properties["organizationId"] = botengine.get_organization_id()
 
-        self._flush(botengine,
-                   [
-                        {
-                            "user_id": self._get_user_id(botengine),
-                            "device_id": self._get_device_id(botengine),
-                            "time": botengine.get_timestamp(),
-                            "event_type": event_name,
-                            "event_properties": properties,
-                            "user_properties": {
-                                "locationId": botengine.get_location_id(),
-                                "organizationId": botengine.get_organization_id()
-                            }
-                        }
-                   ])
+        self._get_events().append({
+            "insert_id": _insert_id(),
+            "user_id": self._get_user_id(botengine),
+            "device_id": self._get_device_id(botengine),
+            "time": botengine.get_timestamp(),
+            "event_type": event_name,
+            "event_properties": properties,
+            "user_properties": {
+                "locationId": botengine.get_location_id(),
+                "organizationId": botengine.get_organization_id()
+            }
+        })
 
     def analytics_people_set(self, botengine, content):
         """
@@ -78,23 +103,9 @@ class LocationAmplitudeMicroservice(Intelligence):
 
         botengine.get_logger().info("analytics.py: Setting user info - {}".format(properties_dict))
 
-        focused_properties = botengine.load_variable(AMPLITUDE_USER_PROPERTIES_VARIABLE_NAME)
-        if focused_properties is None:
-            focused_properties = properties_dict
+        focused_properties = self._get_user_properties(botengine)
         focused_properties.update(properties_dict)
-        focused_properties["locationId"] = botengine.get_location_id()
-        focused_properties["organizationId"] = botengine.get_organization_id()
-        botengine.save_variable(AMPLITUDE_USER_PROPERTIES_VARIABLE_NAME, focused_properties, required_for_each_execution=False)
-
-        self._flush(botengine,
-                    [
-                        {
-                            "user_id": self._get_user_id(botengine),
-                            "device_id": self._get_device_id(botengine),
-                            "time": botengine.get_timestamp(),
-                            "user_properties": focused_properties
-                        }
-                    ])
+        self._user_properties_changed = True
 
     def analytics_people_increment(self, botengine, content):
         """
@@ -109,29 +120,14 @@ class LocationAmplitudeMicroservice(Intelligence):
 
         botengine.get_logger().info("Analytics: Incrementing user info - {}".format(properties_dict))
 
-        focused_properties = botengine.load_variable(AMPLITUDE_USER_PROPERTIES_VARIABLE_NAME)
-
-        if focused_properties is None:
-            focused_properties = properties_dict
+        focused_properties = self._get_user_properties(botengine)
 
         for p in properties_dict:
             if p not in focused_properties:
                 focused_properties[p] = 0
             focused_properties[p] += properties_dict[p]
 
-        focused_properties["locationId"] = botengine.get_location_id()
-        focused_properties["organizationId"] = botengine.get_organization_id()
-        botengine.save_variable(AMPLITUDE_USER_PROPERTIES_VARIABLE_NAME, focused_properties, required_for_each_execution=False)
-
-        self._flush(botengine,
-                    [
-                        {
-                            "user_id": self._get_user_id(botengine),
-                            "device_id": self._get_device_id(botengine),
-                            "time": botengine.get_timestamp(),
-                            "user_properties": focused_properties
-                        }
-                    ])
+        self._user_properties_changed = True
 
     def analytics_people_unset(self, botengine, content):
         """
@@ -146,42 +142,104 @@ class LocationAmplitudeMicroservice(Intelligence):
 
         botengine.get_logger().info("Analytics: Removing user info - {}".format(properties_list))
 
-        focused_properties = botengine.load_variable(AMPLITUDE_USER_PROPERTIES_VARIABLE_NAME)
+        focused_properties = self._get_user_properties(botengine)
+        properties_list = [p for p in properties_list if p in focused_properties]
 
-        if focused_properties is None:
+        if len(properties_list) == 0:
             # Nothing to unset
             return
 
         for p in properties_list:
-            if p in focused_properties:
-                del focused_properties[p]
-
-        focused_properties["locationId"] = botengine.get_location_id()
-        focused_properties["organizationId"] = botengine.get_organization_id()
-        botengine.save_variable(AMPLITUDE_USER_PROPERTIES_VARIABLE_NAME, focused_properties, required_for_each_execution=False)
-
-        self._flush(botengine,
-                    [
-                        {
-                            "user_id": self._get_user_id(botengine),
-                            "device_id": self._get_device_id(botengine),
-                            "time": botengine.get_timestamp(),
-                            "user_properties": focused_properties
-                        }
-                    ])
-
-    def _flush(self, botengine, data):
-        """
-        Required. Implement the mechanisms to flush your analytics.
-        :param botengine: BotEngine
+            del focused_properties[p]
+
+        self._user_properties_changed = True
+
+    def analytics_flush(self, botengine, content):
+        """
+        Send everything buffered during this execution to Amplitude, right before variables get saved.
+
+        All events and one final update of the user properties go out in a single gzip-compressed POST. The HTTP
+        requests happen on a background thread, which the bot joins at the very end of the execution. If they still
+        fail after a few attempts, or are still going when the bot stops waiting, the events are saved to a variable
+        and sent with the next flush that has events. Each event has an insert_id, so Amplitude ignores any event it
+        already received.
+
+        :param botengine: BotEngine environment
+        :param content: None
+        """
+        events = self._get_events()
+        self._events = []
+
+        user_properties = getattr(self, '_user_properties', None)
+        user_properties_changed = getattr(self, '_user_properties_changed', False)
+        self._user_properties = None
+        self._user_properties_changed = False
+
+        if user_properties is not None and user_properties_changed:
+            user_properties["locationId"] = botengine.get_location_id()
+            user_properties["organizationId"] = botengine.get_organization_id()
+            botengine.save_variable(AMPLITUDE_USER_PROPERTIES_VARIABLE_NAME, user_properties, required_for_each_execution=False)
+
+            events.append({
+                "insert_id": _insert_id(),
+                "user_id": self._get_user_id(botengine),
+                "device_id": self._get_device_id(botengine),
+                "time": botengine.get_timestamp(),
+                "user_properties": user_properties
+            })
+
+        if len(events) == 0:
+            return
+
+        token = self._get_token(botengine)
+        if token is None:
+            return
+
+        spilled_events = None
+
+        # Added October 17, 2026 - bots from before this attribute existed check their variable once
+        if getattr(self, 'has_spilled_events', True):
+            spilled_events = botengine.load_variable(AMPLITUDE_SPILLED_EVENTS_VARIABLE_NAME)
+            self.has_spilled_events = bool(spilled_events)
+            if spilled_events:
+                events = spilled_events + events
+
+        # Everything that touches botengine happens here or after the join, so the background thread only talks to Amplitude
+        result = {}
+        analytics.run_in_background(_send, botengine.get_logger(), token, events, result)
+        analytics.run_after_join(self._sent, botengine, events, bool(spilled_events), result)
+
+    def _sent(self, botengine, events, spilled, result):
+        """
+        Forget the events that were delivered, or save them so the next flush can try again.
+        This runs on the main thread after the background thread is done.
+        :param botengine: BotEngine environment
+        :param events: List of Amplitude events that were sent
+        :param spilled: True if the events included events saved by an earlier flush
+        :param result: Dictionary filled in by _send()
+        """
+        if result.get('delivered'):
+            if spilled:
+                botengine.delete_variable(AMPLITUDE_SPILLED_EVENTS_VARIABLE_NAME)
+                self.has_spilled_events = False
+
+        else:
+            # Either it failed, or it's still going and we can't tell. Amplitude drops duplicates by their insert_id.
+            botengine.get_logger().warning("location_amplitude_microservice: Saving {} events to send later".format(len(events)))
+            botengine.save_variable(AMPLITUDE_SPILLED_EVENTS_VARIABLE_NAME, events[-AMPLITUDE_MAXIMUM_SPILLED_EVENTS:], required_for_each_execution=False)
+            self.has_spilled_events = True
+
+    def _get_token(self, botengine):
+        """
+        Get the Amplitude API key for this cloud
+        :param botengine: BotEngine environment
+        :return: API key, or None if there's nowhere to deliver analytics
         """
         if botengine.is_test_location():
             botengine.get_logger().info("Analytics: This test location will not record analytics.")
-            return
+            return None
 
         import domain
-        import json
-        import requests
         import bundle
 
         token = None
@@ -189,44 +247,33 @@ class LocationAmplitudeMicroservice(Intelligence):
             if cloud_address in bundle.CLOUD_ADDRESS:
                 token = domain.AMPLITUDE_TOKENS[cloud_address]
 
-        if token is None:
+        if token is None or token == "":
             # Nothing to do
             botengine.get_logger().info("analytics_amplitude.flush(): No analytics token for {}".format(bundle.CLOUD_ADDRESS))
-            return
+            return None
 
-        if token == "":
-            # Nothing to do
-            botengine.get_logger().info("analytics_amplitude.flush(): No analytics token for {}".format(bundle.CLOUD_ADDRESS))
-            return
-
-        http_headers = {"Content-Type": "application/json"}
-
-        body = {
-            "api_key": token,
-            "events": data
-        }
-
-        url = "https://api.amplitude.com/2/httpapi"
-
-        try:
-            requests.post(url, headers=http_headers, data=json.dumps(body), timeout=AMPLITUDE_HTTP_TIMEOUT_S)
-            botengine.get_logger().info("location_amplitude_microservice: Flushed()")
-
-        except self.requests.HTTPError:
-            self.get_logger().info("Generic HTTP error calling POST " + url)
-
-        except self.requests.ConnectionError:
-            self.get_logger().info("Connection HTTP error calling POST " + url)
-
-        except self.requests.Timeout:
-            self.get_logger().info(str(AMPLITUDE_HTTP_TIMEOUT_S) + " second HTTP Timeout calling POST " + url)
+        return token
 
-        except self.requests.TooManyRedirects:
-            self.get_logger().info("Too many redirects HTTP error calling POST " + url)
-
-        except Exception as e:
-            return
+    def _get_events(self):
+        """
+        Events buffered during this execution
+        :return: List of Amplitude events
+        """
+        if getattr(self, '_events', None) is None:
+            self._events = []
+        return self._events
 
+    def _get_user_properties(self, botengine):
+        """
+        User properties, loaded once per execution and saved when they're flushed
+        :param botengine: BotEngine environment
+        :return: Dictionary of user properties
+        """
+        if getattr(self, '_user_properties', None) is None:
+            self._user_properties = botengine.load_variable(AMPLITUDE_USER_PROPERTIES_VARIABLE_NAME)
+            if self._user_properties is None:
+                self._user_properties = {}
+        return self._user_properties
 
     def _get_user_id(self, botengine):
         """
@@ -243,3 +290,70 @@ class LocationAmplitudeMicroservice(Intelligence):
         :return:
         """
         return botengine.get_bundle_id()
+
+
+def _send(logger, token, data, result):
+    """
+    Send a batch of events to Amplitude. This runs on a background thread, so it must not touch botengine.
+    :param logger: Logger
+    :param token: Amplitude API key
+    :param data: List of Amplitude events
+    :param result: Dictionary to fill in. 'delivered' is True once the events were delivered, or rejected in a way that sending them again won't change.
+    """
+    import gzip
+    import io
+    import json
+    import time
+    import requests
+
+    http_headers = {"Content-Type": "application/json", "Content-Encoding": "gzip"}
+
+    body = {
+        "api_key": token,
+        "events": data
+    }
+
+    compressed = io.BytesIO()
+    with gzip.GzipFile(fileobj=compressed, mode="wb") as f:
+        f.write(json.dumps(body).encode("utf-8"))
+
+    for attempt in range(AMPLITUDE_HTTP_ATTEMPTS):
+        if attempt > 0:
+            time.sleep(0.25 * attempt)
+
+        try:
+            r = requests.post(AMPLITUDE_URL, headers=http_headers, data=compressed.getvalue(), timeout=AMPLITUDE_HTTP_TIMEOUT_S)
+
+            if r.status_code == 429 or r.status_code >= 500:
+                logger.info("HTTP {} calling POST {}".format(r.status_code, AMPLITUDE_URL))
+                continue
+
+            if r.status_code >= 400:
+                # Amplitude rejected these events, and sending them again won't change that
+                logger.warning("location_amplitude_microservice: HTTP {} calling POST {}: {}".format(r.status_code, AMPLITUDE_URL, r.text))
+
+            else:
+                logger.info("location_amplitude_microservice: Flushed {} events".format(len(data)))
+
+            result['delivered'] = True
+            return
+
+        except requests.ConnectionError:
+            logger.info("Connection HTTP error calling POST " + AMPLITUDE_URL)
+
+        except requests.Timeout:
+            logger.info(str(AMPLITUDE_HTTP_TIMEOUT_S) + " second HTTP Timeout calling POST " + AMPLITUDE_URL)
+
+        except requests.RequestException as e:
+            logger.info("HTTP error calling POST {}: {}".format(AMPLITUDE_URL, str(e)))
+
+    result['delivered'] = False
+
+
+def _insert_id():
+    """
+    Unique ID for an event, so Amplitude ignores it if it gets sent again
+    :return: insert_id string
+    """
+    import uuid
+    return uuid.uuid4().hex
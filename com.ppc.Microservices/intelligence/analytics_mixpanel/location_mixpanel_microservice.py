@@ -8,6 +8,7 @@ file 'LICENSE.txt', which is part of this source code package.
 '''
 
 from intelligence.intelligence import Intelligence
+import utilities.analytics as analytics
 import mixpanel
 import domain
 
@@ -31,6 +32,18 @@ class LocationMixpanelMicroservice(Intelligence):
 
         self.analytics_track(botengine, {'event_name': 'reset', 'properties': None})
 
+    def __getstate__(self):
+        """
+        Don't save the analytics buffered during this execution. They get flushed before variables are saved.
+        :return: State of this object to save
+        """
+        state = self.__dict__.copy()
+        state.pop('_tracks', None)
+        state.pop('_people_set', None)
+        state.pop('_people_increment', None)
+        state.pop('_people_unset', None)
+        return state
+
     def analytics_track(self, botengine, content):
         """
         Track an event. This is for a mixpanel-specific implementation.
@@ -47,9 +60,10 @@ class LocationMixpanelMicroservice(Intelligence):
         event_name = content['event_name']
         properties = content['properties']
 
-        mp = mixpanel.Mixpanel(domain.MIXPANEL_TOKEN, consumer=mixpanel.BufferedConsumer(request_timeout=MIXPANEL_HTTP_TIMEOUT_S))
-        mp.track(self._get_distinct_id(botengine), event_name, properties)
-        self._flush(botengine, mp)
+        if properties is not None:
+            properties = dict(properties)
+
+        self._get_buffer('_tracks', list).append((event_name, properties))
 
     def analytics_people_set(self, botengine, content):
         """
@@ -63,9 +77,14 @@ class LocationMixpanelMicroservice(Intelligence):
         properties_dict = content['properties_dict']
 
         botengine.get_logger().info("analytics.py: Setting user info - {}".format(properties_dict))
-        mp = mixpanel.Mixpanel(domain.MIXPANEL_TOKEN, consumer=mixpanel.BufferedConsumer(request_timeout=MIXPANEL_HTTP_TIMEOUT_S))
-        mp.people_set(self._get_distinct_id(botengine), properties_dict)
-        self._flush(botengine, mp)
+        people_increment = self._get_buffer('_people_increment', dict)
+        people_unset = self._get_buffer('_people_unset', set)
+        for p in properties_dict:
+            # The latest value wins over anything done to this property earlier in the execution
+            people_increment.pop(p, None)
+            people_unset.discard(p)
+
+        self._get_buffer('_people_set', dict).update(properties_dict)
 
     def analytics_people_increment(self, botengine, content):
         """
@@ -79,9 +98,21 @@ class LocationMixpanelMicroservice(Intelligence):
         properties_dict = content['properties_dict']
 
         botengine.get_logger().info("Analytics: Incrementing user info - {}".format(properties_dict))
-        mp = mixpanel.Mixpanel(domain.MIXPANEL_TOKEN, consumer=mixpanel.BufferedConsumer(request_timeout=MIXPANEL_HTTP_TIMEOUT_S))
-        mp.people_increment(self._get_distinct_id(botengine), properties_dict)
-        self._flush(botengine, mp)
+        people_set = self._get_buffer('_people_set', dict)
+        people_increment = self._get_buffer('_people_increment', dict)
+        people_unset = self._get_buffer('_people_unset', set)
+        for p in properties_dict:
+            if p in people_set and not isinstance(people_set[p], bool) and isinstance(people_set[p], (int, float)):
+                # Fold the increment into the value we're already setting
+                people_set[p] += properties_dict[p]
+
+            elif p in people_unset:
+                # Nonexistent properties default to zero
+                people_unset.discard(p)
+                people_set[p] = properties_dict[p]
+
+            else:
+                people_increment[p] = people_increment.get(p, 0) + properties_dict[p]
 
     def analytics_people_unset(self, botengine, content):
         """
@@ -95,44 +126,81 @@ class LocationMixpanelMicroservice(Intelligence):
         properties_list = content['properties_list']
 
         botengine.get_logger().info("Analytics: Removing user info - {}".format(properties_list))
-        mp = mixpanel.Mixpanel(domain.MIXPANEL_TOKEN, consumer=mixpanel.BufferedConsumer(request_timeout=MIXPANEL_HTTP_TIMEOUT_S))
-        mp.people_unset(self._get_distinct_id(botengine), properties_list)
-        self._flush(botengine, mp)
+        people_set = self._get_buffer('_people_set', dict)
+        people_increment = self._get_buffer('_people_increment', dict)
+        people_unset = self._get_buffer('_people_unset', set)
+        for p in properties_list:
+            people_set.pop(p, None)
+            people_increment.pop(p, None)
+            people_unset.add(p)
 
-    def _flush(self, botengine, mp):
+    def analytics_flush(self, botengine, content):
         """
-        Required. Implement the mechanisms to flush your analytics.
-        :param botengine: BotEngine
+        Send everything buffered during this execution to Mixpanel, right before variables get saved.
+
+        All updates to the user are merged into one $set, one $add, and one $unset, along with the user account
+        information, and go out with the events through a single connection-pooled consumer. The HTTP requests happen
+        on a background thread, which the bot joins at the very end of the execution.
+
+        :param botengine: BotEngine environment
+        :param content: None
         """
-        try:
-            self._sync_user(botengine, mp)
-            mp._consumer._consumer._request_timeout = MIXPANEL_HTTP_TIMEOUT_S
-            mp._consumer.flush()
+        tracks = self._get_buffer('_tracks', list)
+        people_set = self._get_buffer('_people_set', dict)
+        people_increment = self._get_buffer('_people_increment', dict)
+        people_unset = self._get_buffer('_people_unset', set)
+        self._tracks = None
+        self._people_set = None
+        self._people_increment = None
+        self._people_unset = None
+
+        if botengine.is_test_location():
+            return
 
-        except Exception as e:
-            import traceback
-            botengine.get_logger().error(str(e) + "; " + traceback.format_exc())
+        if len(tracks) == 0 and len(people_set) == 0 and len(people_increment) == 0 and len(people_unset) == 0:
+            return
+
+        # Sync the user account information. Anything the bot set explicitly during this execution wins.
+        user = self._get_user(botengine)
+        for p in people_unset:
+            user.pop(p, None)
+        user.update(people_set)
+
+        # Everything that touches botengine happens here, so the background thread only talks to Mixpanel
+        mp = mixpanel.Mixpanel(domain.MIXPANEL_TOKEN, consumer=mixpanel.BufferedConsumer(request_timeout=MIXPANEL_HTTP_TIMEOUT_S))
+        analytics.run_in_background(_send, mp, botengine.get_logger(), self._get_distinct_id(botengine), tracks, user, people_increment, list(people_unset))
 
-    def _sync_user(self, botengine, mp):
+    def _get_buffer(self, name, buffer_type):
         """
-        Sync the user account information
+        Analytics buffered during this execution
+        :param name: Attribute name of the buffer
+        :param buffer_type: list, dict, or set
+        :return: The buffer
+        """
+        if getattr(self, name, None) is None:
+            setattr(self, name, buffer_type())
+        return getattr(self, name)
+
+    def _get_user(self, botengine):
+        """
+        Get the user account information
         :param botengine: BotEngine environment
+        :return: Dictionary of properties to set on the user
         """
         anonymize = False
         if hasattr(domain, "ANONYMIZE_ANALYTICS"):
             anonymize = domain.ANONYMIZE_ANALYTICS
 
         if anonymize:
-            mp.people_set(self._get_distinct_id(botengine), {
+            return {
                 'location_id': botengine.get_location_id()
-            })
+            }
 
-        else:
-            mp.people_set(self._get_distinct_id(botengine), {
-                'location_id': botengine.get_location_id(),
-                '$first_name': botengine.get_location_name(),
-                '$last_name': ""
-            })
+        return {
+            'location_id': botengine.get_location_id(),
+            '$first_name': botengine.get_location_name(),
+            '$last_name': ""
+        }
 
     def _get_distinct_id(self, botengine):
         """
@@ -145,4 +213,36 @@ class LocationMixpanelMicroservice(Intelligence):
             distinct_id = botengine.get_location_id()
             botengine.save_variable(VARIABLE_DISTINCT_ID, distinct_id, required_for_each_execution=True)
 
-        return distinct_id
\ No newline at end of file
+        return distinct_id
+
+
+def _send(mp, logger, distinct_id, tracks, people_set, people_increment, people_unset):
+    """
+    Send a batch of analytics to Mixpanel. This runs on a background thread, so it must not touch botengine.
+    :param mp: Mixpanel client with a BufferedConsumer
+    :param logger: Logger
+    :param distinct_id: Distinct ID for this user
+    :param tracks: List of (event_name, properties) tuples
+    :param people_set: Dictionary of properties to set
+    :param people_increment: Dictionary of properties to increment
+    :param people_unset: List of properties to remove
+    """
+    try:
+        for event_name, properties in tracks:
+            mp.track(distinct_id, event_name, properties)
+
+        if len(people_set) > 0:
+            mp.people_set(distinct_id, people_set)
+
+        if len(people_increment) > 0:
+            mp.people_increment(distinct_id, people_increment)
+
+        if len(people_unset) > 0:
+            mp.people_unset(distinct_id, people_unset)
+
+        mp._consumer.flush()
+        logger.info("location_mixpanel_microservice: Flushed {} events".format(len(tracks)))
+
+    except Exception as e:
+        import traceback
+        logger.error(str(e) + "; " + traceback.format_exc())
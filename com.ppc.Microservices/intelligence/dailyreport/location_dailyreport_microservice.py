@@ -94,6 +94,17 @@ class LocationDailyReportMicroservice(Intelligence):
 
         return
 
+    def __getstate__(self):
+        """
+        Don't save the in-memory copy of the report. It's written back before variables are saved,
+        and loaded again the next time an entry is added.
+        :return: State of this object to save
+        """
+        state = self.__dict__.copy()
+        for name in ['_report', '_report_ms', '_sections', '_items', '_report_changed', '_report_created']:
+            state.pop(name, None)
+        return state
+
     def destroy(self, botengine):
         """
         This device or object is getting permanently deleted - it is no longer in the user's account.
@@ -185,16 +196,6 @@ class LocationDailyReportMicroservice(Intelligence):
         """
         return
 
-    def datastream_updated(self, botengine, address, content):
-        """
-        Data Stream Message Received
-        :param botengine: BotEngine environment
-        :param address: Data Stream address
-        :param content: Content of the message
-        """
-        if hasattr(self, address):
-            getattr(self, address)(botengine, content)
-
     def schedule_fired(self, botengine, schedule_id):
         """
         The bot executed on a hard coded schedule specified by our runtime.json file
@@ -257,6 +258,9 @@ class LocationDailyReportMicroservice(Intelligence):
                 self.add_entry(botengine, SECTION_ID_SLEEP, comment=_("Hasn't gone to sleep by midnight."), include_timestamp=True)
             self.email_report(botengine)
 
+        # Finish writing the previous report before we move on
+        self._flush_report(botengine)
+
         # Create a new report
         self.current_report_ms = int(botengine.get_timestamp() / 1000.0) * 1000
         report = {}
@@ -270,7 +274,10 @@ class LocationDailyReportMicroservice(Intelligence):
         report['subtitle'] = _("Daily Report for {}").format(self.parent.get_local_datetime(botengine).strftime("%A %B %-d, %Y"))
         report['created_ms'] = botengine.get_timestamp()
         report['sections'] = []
-        self.parent.set_location_property_separately(botengine, DAILY_REPORT_ADDRESS, report, overwrite=True, timestamp_ms=self.current_report_ms)
+        self._load_report(botengine, report, self.current_report_ms)
+
+        # The new report gets written even if it stays empty, so later executions can find it
+        self._report_created = True
 
         # Add our first entry if possible.
         if self.started_sleeping_ms is not None and "SLEEP" in self.parent.occupancy_status:
@@ -323,19 +330,17 @@ class LocationDailyReportMicroservice(Intelligence):
         :param timestamp_override_ms: Optional timestamp in milliseconds to override the current time when citing the timestamp with include_timestamp=True
         """
         botengine.get_logger().info("location_dailyreport_microservice.add_entry(): Current report timestamp is {}".format(self.current_report_ms))
-        report = botengine.get_ui_content(DAILY_REPORT_ADDRESS, timestamp_ms=self.current_report_ms)
+        report = self._get_report(botengine)
         if report is None:
             botengine.get_logger().info("location_dailyreport_microservice: There is currently no active daily report.")
             self.midnight_fired(botengine)
-            report = botengine.get_ui_content(DAILY_REPORT_ADDRESS, self.current_report_ms)
+            report = self._get_report(botengine)
             if report is None:
                 return
             else:
-                botengine.get_logger().info("location_dailyreport_microservice: Successfully created and loaded a new report.")
-        else:
-            botengine.get_logger().info("location_dailyreport_microservice: Successfully loaded an existing report.")
+                botengine.get_logger().info("location_dailyreport_microservice: Successfully created a new report.")
 
-        focused_section = self._get_section_object(botengine, report, section_id)
+        focused_section = self._sections.get(section_id)
         if focused_section is None:
             botengine.get_logger().info("location_dailyreport_microservice: Need to create a new section for section_id '{}'.".format(section_id))
             if section_id == SECTION_ID_ALERTS:
@@ -457,6 +462,10 @@ class LocationDailyReportMicroservice(Intelligence):
 
             report['sections'].append(focused_section)
             report['sections'] = sorted(report['sections'], key=lambda k: k['weight'])
+            self._sections[section_id] = focused_section
+            self._items[section_id] = {}
+
+        self._report_changed = True
 
         if comment is not None or identifier is not None:
             if include_timestamp and comment is not None:
@@ -481,16 +490,11 @@ class LocationDailyReportMicroservice(Intelligence):
                     "timestamp_ms": ts,
                     "comment": comment
                 }
-                focused_section['items'].append(focused_item)
-                focused_section['items'] = sorted(focused_section['items'], key=lambda k: k['timestamp_ms'])
+                _insert_item(focused_section['items'], focused_item)
 
             else:
                 # Try to overwrite any previous entry with this identifier
-                focused_item = None
-                for item in focused_section['items']:
-                    if 'id' in item:
-                        if item['id'] == identifier:
-                            focused_item = item
+                focused_item = self._items[section_id].get(identifier)
 
                 if focused_item is not None:
                     # Edit the item in place
@@ -500,18 +504,21 @@ class LocationDailyReportMicroservice(Intelligence):
                         if timestamp_override_ms is not None:
                             ts = timestamp_override_ms
 
+                        focused_section['items'].remove(focused_item)
                         focused_item['timestamp_ms'] = ts
                         focused_item['comment'] = comment
-                        focused_section['items'] = sorted(focused_section['items'], key=lambda k: k['timestamp_ms'])
+                        _insert_item(focused_section['items'], focused_item)
 
                     else:
                         # Delete the item
                         focused_section['items'].remove(focused_item)
-                        focused_section['items'] = sorted(focused_section['items'], key=lambda k: k['timestamp_ms'])
+                        del self._items[section_id][identifier]
 
                         if len(focused_section['items']) == 0:
                             # Delete the entire section
                             report['sections'].remove(focused_section)
+                            del self._sections[section_id]
+                            del self._items[section_id]
 
                 else:
                     # Add the item
@@ -524,8 +531,8 @@ class LocationDailyReportMicroservice(Intelligence):
                         "comment": comment,
                         "id": identifier
                     }
-                    focused_section['items'].append(focused_item)
-                    focused_section['items'] = sorted(focused_section['items'], key=lambda k: k['timestamp_ms'])
+                    _insert_item(focused_section['items'], focused_item)
+                    self._items[section_id][identifier] = focused_item
 
         if subtitle is not None:
             # Manually defined subtitle for this section
@@ -573,7 +580,14 @@ class LocationDailyReportMicroservice(Intelligence):
                 elif len(focused_section['items']) > 1:
                     focused_section['subtitle'] = _("Visited the bathroom {} times today.").format(len(focused_section['items']))
 
-        self.parent.set_location_property_separately(botengine, DAILY_REPORT_ADDRESS, report, overwrite=True, timestamp_ms=self.current_report_ms)
+    def location_properties_flush(self, botengine, content):
+        """
+        Data stream message - The location properties are about to be written back at the end of this execution.
+        Write back the report first, because it's stored as a separate location property.
+        :param botengine: BotEngine environment
+        :param content: None
+        """
+        self._flush_report(botengine)
 
     def email_report(self, botengine):
         """
@@ -584,21 +598,64 @@ class LocationDailyReportMicroservice(Intelligence):
         # TODO
         return
 
-    def _get_section_object(self, botengine, report, section_id):
+    def _get_report(self, botengine):
         """
-        Find and return a section object out of all the sections in the report dictionary that is passed in
-        :param botengine:
+        Get the current report, loading it from the server once per execution
+        :param botengine: BotEngine environment
+        :return: report dictionary object, or None if there is no current report
+        """
+        if getattr(self, '_report', None) is None or self._report_ms != self.current_report_ms:
+            report = botengine.get_ui_content(DAILY_REPORT_ADDRESS, timestamp_ms=self.current_report_ms)
+            if report is None:
+                return None
+
+            botengine.get_logger().info("location_dailyreport_microservice: Successfully loaded an existing report.")
+            self._load_report(botengine, report, self.current_report_ms)
+
+        return self._report
+
+    def _load_report(self, botengine, report, report_ms):
+        """
+        Keep the report in memory, indexed by section ID and item identifier
+        :param botengine: BotEngine environment
         :param report: report dictionary object
-        :param section_id: section ID to return
-        :return: section object dictionary, or None if it doesn't exist
+        :param report_ms: Timestamp of the report
+        """
+        self._report = report
+        self._report_ms = report_ms
+        self._report_changed = False
+        self._report_created = False
+        self._sections = {}
+        self._items = {}
+
+        for section in report.get('sections', []):
+            self._sections[section['id']] = section
+            self._items[section['id']] = {}
+            for item in section['items']:
+                if 'id' in item:
+                    self._items[section['id']][item['id']] = item
+
+    def _flush_report(self, botengine):
+        """
+        Write the report back to the server if it was created or changed during this execution.
+
+        A new report is written in full. Otherwise the whole list of sections is rewritten, including the sections that
+        didn't change, leaving the title and the rest of the report untouched. The sections are one list inside one
+        piece of content, so there's no way to write back only the sections that changed.
+
+        :param botengine: BotEngine environment
         """
-        if report is not None:
-            if 'sections' in report:
-                for section in report['sections']:
-                    if section['id'] == section_id:
-                        return section
+        if not getattr(self, '_report_created', False) and not getattr(self, '_report_changed', False):
+            return
+
+        if self._report_created:
+            self.parent.set_location_property_separately(botengine, DAILY_REPORT_ADDRESS, self._report, overwrite=True, timestamp_ms=self._report_ms)
 
-        return None
+        else:
+            self.parent.set_location_property_separately(botengine, DAILY_REPORT_ADDRESS, {'sections': self._report['sections']}, overwrite=False, timestamp_ms=self._report_ms)
+
+        self._report_changed = False
+        self._report_created = False
 
     def _get_resident_name(self, botengine):
         """
@@ -630,3 +687,15 @@ class LocationDailyReportMicroservice(Intelligence):
 
         return name
 
+
+def _insert_item(items, item):
+    """
+    Insert an item into a list of items sorted by timestamp, after any items with the same timestamp.
+    New items are usually the latest, so this searches from the end.
+    :param items: List of items sorted by 'timestamp_ms'
+    :param item: Item to insert
+    """
+    i = len(items)
+    while i > 0 and items[i - 1]['timestamp_ms'] > item['timestamp_ms']:
+        i -= 1
+    items.insert(i, item)
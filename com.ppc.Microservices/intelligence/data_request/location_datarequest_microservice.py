@@ -7,9 +7,14 @@ file 'LICENSE.txt', which is part of this source code package.
 @author: David Moss
 '''
 
+import csv
+import io
+import zlib
+
 from intelligence.intelligence import Intelligence
 import utilities.utilities as utilities
 import utilities.analytics as analytics
+import datarequest
 import domain
 
 from devices.entry.entry import EntryDevice
@@ -19,6 +24,24 @@ from devices.pressure.pressure import PressurePadDevice
 # Reference to use when requesting data so we know the response is ours
 DATA_REQUEST_REFERENCE = "all"
 
+# Reference to use when requesting only the data we haven't downloaded yet.
+# The response gets merged with the data we already have and delivered to everyone again as DATA_REQUEST_REFERENCE.
+INCREMENTAL_DATA_REQUEST_REFERENCE = "all.incremental"
+
+# Variable name of the newest timestamp we've downloaded for each device. { 'device_id': timestamp_ms }
+HIGH_WATER_MARKS_VARIABLE_NAME = "data_request_high_water_marks"
+
+# Variable name prefix of the zlib-compressed CSV segments we've downloaded for each device, oldest first
+SEGMENTS_VARIABLE_PREFIX = "data_request_segments."
+
+# Maximum number of segments to keep for each device before compacting them into one
+MAXIMUM_SEGMENTS = 8
+
+# How much history to keep for each device, which bounds the size of the stored segments. The first download for a
+# device asks for this much history, and older rows are dropped when segments are compacted or delivered.
+# Set this to None to ask the server for its default range on the first download and keep everything.
+DOWNLOAD_HORIZON_MS = utilities.ONE_WEEK_MS * 12
+
 # For debugging, export CSV data to local files
 EXPORT_CSV_TO_LOCAL_FILES = False
 
@@ -96,16 +119,6 @@ class LocationDataRequestMicroservice(Intelligence):
 
         return
 
-    def datastream_updated(self, botengine, address, content):
-        """
-        Data Stream Message Received
-        :param botengine: BotEngine environment
-        :param address: Data Stream address
-        :param content: Content of the message
-        """
-        if hasattr(self, address):
-            getattr(self, address)(botengine, content)
-
     def schedule_fired(self, botengine, schedule_id):
         """
         The bot executed on a hard coded schedule specified by our runtime.json file
@@ -147,6 +160,11 @@ class LocationDataRequestMicroservice(Intelligence):
             self.last_download = botengine.get_timestamp()
             botengine.get_logger().info("location_datarequest_microservice.download_data() - Requesting data")
 
+            # Only request data newer than what we already have for each device
+            high_water_marks = botengine.load_variable(HIGH_WATER_MARKS_VARIABLE_NAME)
+            if high_water_marks is None:
+                high_water_marks = {}
+
             # Request all data from devices that capture interesting information
             for device_id in self.parent.devices:
                 focused_object = self.parent.devices[device_id]
@@ -154,12 +172,12 @@ class LocationDataRequestMicroservice(Intelligence):
                 if DOWNLOAD_FOCUSED_DEVICES_ONLY:
                     # Download focused devices only based on the list below.
                     if isinstance(focused_object, MotionDevice) or isinstance(focused_object, EntryDevice) or isinstance(focused_object, PressurePadDevice):
-                        focused_object.request_data(botengine, param_name_list=focused_object.MEASUREMENT_PARAMETERS_LIST, reference=DATA_REQUEST_REFERENCE)
+                        self._request_new_data(botengine, focused_object, high_water_marks.get(device_id))
 
                 else:
                     # Download any device with a focused measurements parameters list.
                     if hasattr(focused_object, 'MEASUREMENT_PARAMETERS_LIST'):
-                        focused_object.request_data(botengine, param_name_list=focused_object.MEASUREMENT_PARAMETERS_LIST, reference=DATA_REQUEST_REFERENCE)
+                        self._request_new_data(botengine, focused_object, high_water_marks.get(device_id))
 
         else:
             botengine.get_logger().info("location_datarequest_microservice: Attempted to download_data(), but we just did so recently so skipping this request.")
@@ -195,8 +213,11 @@ class LocationDataRequestMicroservice(Intelligence):
 
         :param botengine: BotEngine environment
         :param reference: Optional reference passed into botengine.request_data(..)
-        :param csv_dict: { device_object: 'csv data string' }
+        :param csv_dict: { device_object: bytes or SpooledCsv }
         """
+        if reference == INCREMENTAL_DATA_REQUEST_REFERENCE:
+            self._merge_new_data(botengine, csv_dict)
+
         if reference == DATA_REQUEST_REFERENCE:
             botengine.save_variable("data_request_timestamp", botengine.get_timestamp())
 
@@ -216,10 +237,184 @@ class LocationDataRequestMicroservice(Intelligence):
 
                 filename = "{}_{}.csv".format(d.device_id, d.device_type)
                 if EXPORT_CSV_TO_LOCAL_FILES:
-                    with open(filename, "w") as text_file:
+                    with open(filename, "wb") as csv_file:
                         botengine.get_logger().info("Saving CSV data to {} ...".format(filename))
-                        text_file.write(csv_dict[d])
+                        if isinstance(csv_dict[d], datarequest.SpooledCsv):
+                            csv_dict[d].write_to(csv_file)
+                        else:
+                            csv_file.write(csv_dict[d])
 
 
         # It is up to the developer to capture the data_request_ready(..) event in their own microservice
-        # and verify the reference is 'all', then do something with all this data.
\ No newline at end of file
+        # and verify the reference is 'all', then do something with all this data.
+
+    def _request_new_data(self, botengine, device_object, high_water_mark_ms):
+        """
+        Request the data from this device that's newer than what we already have
+        :param botengine: BotEngine environment
+        :param device_object: Device object
+        :param high_water_mark_ms: Newest timestamp we've already downloaded for this device, or None to download everything within our horizon
+        """
+        oldest_timestamp_ms = _oldest_timestamp_ms(botengine)
+        if high_water_mark_ms is not None:
+            oldest_timestamp_ms = max(oldest_timestamp_ms or 0, high_water_mark_ms + 1)
+
+        device_object.request_data(botengine, oldest_timestamp_ms=oldest_timestamp_ms, newest_timestamp_ms=botengine.get_timestamp(), param_name_list=device_object.MEASUREMENT_PARAMETERS_LIST, reference=INCREMENTAL_DATA_REQUEST_REFERENCE)
+
+    def _merge_new_data(self, botengine, csv_dict):
+        """
+        Append newly downloaded data to each device's stored segments, then deliver the complete data for every
+        device to all microservices with the DATA_REQUEST_REFERENCE.
+
+        Responses can overlap or arrive out of order, so only the rows newer than a device's high-water mark are kept,
+        and the high-water mark moves up to the newest row we actually received.
+
+        Class variables don't get saved during a data request trigger, so the segments and high-water marks are saved
+        in their own variables.
+
+        :param botengine: BotEngine environment
+        :param csv_dict: { device_object: bytes or SpooledCsv } of new data
+        """
+        high_water_marks = botengine.load_variable(HIGH_WATER_MARKS_VARIABLE_NAME)
+        if high_water_marks is None:
+            high_water_marks = {}
+
+        # Forget the devices that aren't at this location anymore
+        for device_id in list(high_water_marks.keys()):
+            if device_id not in self.parent.devices:
+                botengine.delete_variable(SEGMENTS_VARIABLE_PREFIX + device_id)
+                del high_water_marks[device_id]
+
+        oldest_timestamp_ms = _oldest_timestamp_ms(botengine)
+        device_ids = set(high_water_marks.keys()) | set(d.device_id for d in csv_dict)
+        segments = botengine.load_variables([SEGMENTS_VARIABLE_PREFIX + device_id for device_id in device_ids])
+
+        for d in csv_dict:
+            name = SEGMENTS_VARIABLE_PREFIX + d.device_id
+            header, rows = _read_csv(csv_dict[d][:])
+            if header is None:
+                continue
+
+            if 'timestamp_ms' not in header:
+                botengine.get_logger().warning("location_datarequest_microservice: No 'timestamp_ms' column in the data for {}".format(d.device_id))
+                continue
+
+            timestamp_index = header.index('timestamp_ms')
+            high_water_mark_ms = high_water_marks.get(d.device_id)
+            if high_water_mark_ms is not None:
+                rows = [row for row in rows if int(row[timestamp_index]) > high_water_mark_ms]
+
+            if len(rows) == 0:
+                # Nothing we don't already have, for example because a later request overlapped this one
+                continue
+
+            device_segments = segments.get(name)
+            if device_segments is None or high_water_mark_ms is None:
+                device_segments = []
+
+            device_segments.append(zlib.compress(_write_csv(header, rows)))
+
+            if len(device_segments) > MAXIMUM_SEGMENTS:
+                device_segments = [zlib.compress(_merge_segments(device_segments, oldest_timestamp_ms))]
+
+            segments[name] = device_segments
+            botengine.save_variable(name, device_segments)
+            high_water_marks[d.device_id] = max([int(row[timestamp_index]) for row in rows] + [high_water_mark_ms or 0])
+
+        botengine.save_variable(HIGH_WATER_MARKS_VARIABLE_NAME, high_water_marks)
+
+        merged = datarequest.CsvDict()
+        try:
+            for device_id in high_water_marks:
+                device_segments = segments.get(SEGMENTS_VARIABLE_PREFIX + device_id)
+                if device_id in self.parent.devices and device_segments:
+                    merged[self.parent.devices[device_id]] = datarequest.csv_content(_merge_segments(device_segments, oldest_timestamp_ms))
+
+            self.parent.data_request_ready(botengine, DATA_REQUEST_REFERENCE, merged)
+
+        finally:
+            for csv_data in merged.values():
+                datarequest.close(csv_data)
+
+
+def _oldest_timestamp_ms(botengine):
+    """
+    :param botengine: BotEngine environment
+    :return: Oldest timestamp of the history we keep, or None to keep everything. See DOWNLOAD_HORIZON_MS.
+    """
+    if DOWNLOAD_HORIZON_MS is None:
+        return None
+    return botengine.get_timestamp() - DOWNLOAD_HORIZON_MS
+
+
+def _merge_segments(segments, oldest_timestamp_ms=None):
+    """
+    Merge compressed CSV segments into one CSV with one header row.
+
+    A parameter with no data in one download is missing from that segment's columns, so the header is the union of
+    every segment's columns, and each row is lined up under it by column name.
+
+    :param segments: List of zlib-compressed CSV segments, oldest first
+    :param oldest_timestamp_ms: Drop rows older than this, or None to keep everything
+    :return: Uncompressed CSV bytes
+    """
+    header = []
+    parsed = []
+    for segment in segments:
+        segment_header, rows = _read_csv(zlib.decompress(segment))
+        if segment_header is None:
+            continue
+
+        for title in segment_header:
+            if title not in header:
+                header.append(title)
+
+        parsed.append((segment_header, rows))
+
+    if len(header) == 0:
+        return b""
+
+    timestamp_index = None
+    if 'timestamp_ms' in header:
+        timestamp_index = header.index('timestamp_ms')
+
+    merged = []
+    for segment_header, rows in parsed:
+        if segment_header != header:
+            positions = [segment_header.index(title) if title in segment_header else None for title in header]
+            rows = [[row[i] if i is not None and i < len(row) else "" for i in positions] for row in rows]
+
+        if oldest_timestamp_ms is not None and timestamp_index is not None:
+            rows = [row for row in rows if int(row[timestamp_index]) >= oldest_timestamp_ms]
+
+        merged += rows
+
+    return _write_csv(header, merged)
+
+
+def _read_csv(data):
+    """
+    Parse CSV data
+    :param data: CSV bytes
+    :return: ( ['column title'], [ [row values] ] ), or (None, []) if there's no header row
+    """
+    reader = csv.reader(data.decode('utf-8').splitlines())
+    header = next(reader, None)
+    if header is None:
+        return None, []
+
+    return [title.strip() for title in header], [row for row in reader if len(row) > 0]
+
+
+def _write_csv(header, rows):
+    """
+    Write CSV data
+    :param header: ['column title']
+    :param rows: [ [row values] ]
+    :return: CSV bytes
+    """
+    f = io.StringIO()
+    writer = csv.writer(f, lineterminator="\n")
+    writer.writerow(header)
+    writer.writerows(rows)
+    return f.getvalue().encode('utf-8')
@@ -14,6 +14,7 @@ import importlib
 import datetime
 import utilities.utilities as utilities
 import utilities.analytics as analytics
+import utilities.timestamps as timestamps
 
 from intelligence.intelligence import Intelligence
 
@@ -193,13 +194,14 @@ class LocationDaylightMicroservice(Intelligence):
             now = datetime.datetime.now(dt.tzinfo)
             if dt < now:
                 dt = dt + datetime.timedelta(hours=24)
-            return int(dt.strftime('%s')) * 1000
+            return timestamps.datetime_to_timestamp_ms(dt)
 
         o = ephem.Observer()
         o.lat = str(self.parent.latitude)
         o.long = str(self.parent.longitude)
-        dt = ephem.localtime(o.next_rising(ephem.Sun()))
-        return int(dt.strftime('%s')) * 1000
+        # ephem dates are in UTC
+        dt = o.next_rising(ephem.Sun()).datetime()
+        return timestamps.datetime_to_timestamp_ms(dt)
 
     def next_sunset_timestamp_ms(self, botengine):
         """
@@ -218,13 +220,14 @@ class LocationDaylightMicroservice(Intelligence):
             if dt < now:
                 dt = dt + datetime.timedelta(hours=24)
 
-            return int(dt.strftime('%s')) * 1000
+            return timestamps.datetime_to_timestamp_ms(dt)
 
         o = ephem.Observer()
         o.lat = str(self.parent.latitude)
         o.long = str(self.parent.longitude)
-        dt = ephem.localtime(o.next_setting(ephem.Sun()))
-        return int(dt.strftime('%s')) * 1000
+        # ephem dates are in UTC
+        dt = o.next_setting(ephem.Sun()).datetime()
+        return timestamps.datetime_to_timestamp_ms(dt)
 
     def _set_sunrise_sunset_alarm(self, botengine):
         """